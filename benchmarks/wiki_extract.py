@@ -0,0 +1,93 @@
+"""Compares the old BeautifulSoup summary extraction with wiki_parse on large article fixtures.
+
+Usage:
+    python benchmarks/wiki_extract.py                      # Run against benchmarks/fixtures/*.html
+    python benchmarks/wiki_extract.py --fetch Python_(programming_language) Earth
+                                                           # Save real articles as fixtures first
+
+No article fixtures are committed (Wikipedia can't be reached from every build environment), so unless some were
+saved with --fetch, a large synthetic article shaped like MediaWiki output is generated instead. Its numbers are
+only comparable between candidates, not to real pages.
+"""
+# Other Imports
+from urllib.request import Request, urlopen
+from timeit import repeat
+import glob
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import wiki_parse  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def old_summary(page: bytes) -> tuple:
+    """The extraction WikiTools.search used before wiki_parse"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page, "html.parser")
+    all_paragraphs = soup.find_all("p")
+    summary = [p.get_text() for p in all_paragraphs if p.get_text() != "\n"][0]
+    return soup.find(id='firstHeading').string, summary
+
+
+def synthetic_article(num_sections: int = 100, paragraphs_per_section: int = 20) -> bytes:
+    """Returns a large page laid out like a MediaWiki article: an infobox table before the first paragraph, and
+sections with edit links whose paragraphs have links and reference markers"""
+    paragraph = ("<p>Lorem <b>ipsum</b> dolor sit amet, <a href='/wiki/X'>consectetur</a> adipiscing elit."
+                 "<sup class='reference'><a href='#cite_note-1'>[1]</a></sup></p>\n")
+    infobox = ("<table class='infobox'><tbody>"
+               + "<tr><th>Field</th><td><a href='/wiki/Y'>Value</a></td></tr>" * 30
+               + "</tbody></table>")
+    section = ("<h2><span class='mw-headline'>Section</span><span class='mw-editsection'>[<a href='?action=edit'>"
+               "edit</a>]</span></h2>\n" + paragraph * paragraphs_per_section)
+    return ("<html><head><title>Synthetic</title></head><body>"
+            "<h1 id='firstHeading' class='firstHeading'><span>Synthetic Article</span></h1>"
+            "<div class='mw-parser-output'>" + infobox + "<p class='mw-empty-elt'>\n</p>"
+            + section * num_sections
+            + "</div></body></html>").encode("utf-8")
+
+
+def fetch_fixtures(titles: list) -> None:
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for title in titles:
+        request = Request(f"https://en.wikipedia.org/wiki/{title}", headers={"User-Agent": "Robo-Dart benchmark"})
+        with urlopen(request) as response, open(os.path.join(FIXTURE_DIR, f"{title}.html"), "wb") as f:
+            f.write(response.read())
+        print(f"Saved {title}")
+
+
+def load_fixtures() -> dict:
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures or {"synthetic (generated)": synthetic_article()}
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["--fetch"]:
+        fetch_fixtures(sys.argv[2:])
+
+    candidates = {"stdlib early exit": lambda page: wiki_parse._parse_stdlib(page, 1)}
+    if wiki_parse.etree is not None:
+        candidates["lxml early exit"] = lambda page: wiki_parse._parse_lxml(page, 1)
+    try:
+        import bs4  # noqa: F401
+        candidates["bs4 (old)"] = old_summary
+    except ImportError:
+        print("bs4 isn't installed, skipping the old extraction")
+
+    fixtures = load_fixtures()
+    if "synthetic (generated)" in fixtures:
+        print("No article fixtures found, using a synthetic page. "
+              "Save real articles with --fetch first for representative numbers.")
+    for name, page in fixtures.items():
+        print(f"\n{name} ({len(page) / 1024:.0f} KiB)")
+        for candidate, func in candidates.items():
+            best = min(repeat(lambda: func(page), number=5, repeat=3)) / 5
+            print(f"  {candidate:<20} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
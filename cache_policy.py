@@ -0,0 +1,223 @@
+"""How much of each guild's members and presences the bot keeps in memory, and fetching the members it doesn't"""
+# Discord Imports
+import discord
+from discord.ext import commands
+
+# Other Imports
+from collections import OrderedDict
+from enum import Enum
+import asyncio
+import time
+import sys
+import os
+
+POLICIES = ("full", "lazy", "minimal")
+SHARED_ATTRIBUTES = {"guild", "_state"}  # Referenced by every member, so not part of any one member's size
+
+
+def _size(obj, seen: set, depth: int = 4) -> int:
+    """Roughly how many bytes an object and what it references take up"""
+    if id(obj) in seen or depth < 0 or isinstance(obj, (Enum, type)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        children = [*obj.keys(), *obj.values()]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    else:
+        names = list(getattr(obj, "__dict__", ()))
+        for cls in type(obj).__mro__:
+            slots = getattr(cls, "__slots__", ())
+            names += [slots] if isinstance(slots, str) else list(slots)
+        children = [getattr(obj, name, None) for name in names if name not in SHARED_ATTRIBUTES]
+    return size + sum(_size(child, seen, depth - 1) for child in children)
+
+
+def resident_memory() -> int:
+    """Returns the resident memory of this process in bytes, or 0 if it can't be read"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class CachePolicy:
+    """Chooses which members discord.py caches, set with the CACHE_POLICY environment variable:
+
+full: every member and presence of every guild, chunked at startup (the default, and what the bot always did)
+lazy: presences only for cached members, members are cached as they join and a guild is only chunked once something
+      needs all of its members
+minimal: no presences and no member cache, members are fetched when needed and the newest `max_fetched` are kept
+
+Cogs should get members through `get_member`, which falls back to fetching them if the policy didn't keep them.
+Fetched members, and users found not to be in a guild (up to `max_absent`), are remembered for `fetched_ttl`
+seconds, or until a gateway event says they changed."""
+    def __init__(self, name: str = "full", *, max_fetched: int = 1000, max_absent: int = 50000,
+                 fetched_ttl: float = 600.0):
+        if name not in POLICIES:
+            raise ValueError(f"Unknown cache policy {name!r}, expected one of {', '.join(POLICIES)}")
+        self.name = name
+        self.max_fetched = max_fetched
+        self.max_absent = max_absent
+        self.fetched_ttl = fetched_ttl
+        self.bot = None
+        self.stats = {"cache_hits": 0, "fetched_hits": 0, "absent_hits": 0, "fetches": 0, "not_found": 0}
+        self._fetched = OrderedDict()  # (guild id, user id) -> (expires at, Member)
+        self._absent = OrderedDict()   # (guild id, user id) -> expires at, for users that aren't in the guild
+        self._chunking = {}            # guild id -> task chunking the guild
+        self._fetch_limit = asyncio.Semaphore(5)
+
+    def client_options(self, intents: discord.Intents) -> dict:
+        """Sets up the intents for the policy, returns the options to create the bot with"""
+        if self.name == "full":
+            return {}
+        intents.presences = self.name == "lazy"
+        flags = discord.MemberCacheFlags.none()
+        if self.name == "lazy":
+            flags.joined = True
+            flags.voice = intents.voice_states
+        return {"member_cache_flags": flags, "chunk_guilds_at_startup": False}
+
+    def attach(self, bot: commands.Bot) -> None:
+        """Hooks into the bot's events, must be called before it connects"""
+        self.bot = bot
+        bot.add_listener(self.on_member_join, "on_member_join")
+
+        # discord.py only dispatches on_member_remove for cached members, so tell cogs about the others too
+        state = bot._connection
+        parse_member_remove = state.parsers["GUILD_MEMBER_REMOVE"]
+
+        def parse_guild_member_remove(data):
+            guild = state._get_guild(int(data["guild_id"]))
+            user_id = int(data["user"]["id"])
+            if guild is not None and guild.get_member(user_id) is None:
+                member = self._fetched.pop((guild.id, user_id), (None, None))[1]
+                bot.dispatch("uncached_member_remove", guild, member or discord.User(state=state, data=data["user"]))
+            if guild is not None:
+                self._remember_absent((guild.id, user_id))
+            parse_member_remove(data)
+
+        # Fetched members aren't in discord.py's cache, so it doesn't update them, fetch them again instead
+        parse_member_update = state.parsers["GUILD_MEMBER_UPDATE"]
+
+        def parse_guild_member_update(data):
+            self.forget(int(data["guild_id"]), int(data["user"]["id"]))
+            parse_member_update(data)
+
+        state.parsers["GUILD_MEMBER_REMOVE"] = parse_guild_member_remove
+        state.parsers["GUILD_MEMBER_UPDATE"] = parse_guild_member_update
+
+    async def on_member_join(self, member):
+        self._absent.pop((member.guild.id, member.id), None)
+
+    def forget(self, guild_id: int, user_id: int) -> None:
+        """Drops a fetched member so they're fetched again next time, should be called after editing them since
+`member.edit` doesn't change the member it's called on"""
+        self._fetched.pop((guild_id, user_id), None)
+
+    def _remember(self, key: tuple, member) -> None:
+        self._absent.pop(key, None)
+        self._fetched[key] = (time.monotonic() + self.fetched_ttl, member)
+        self._fetched.move_to_end(key)
+        while len(self._fetched) > self.max_fetched:
+            self._fetched.popitem(last=False)
+
+    def _remember_absent(self, key: tuple) -> None:
+        self._fetched.pop(key, None)
+        self._absent[key] = time.monotonic() + self.fetched_ttl
+        self._absent.move_to_end(key)
+        while len(self._absent) > self.max_absent:
+            self._absent.popitem(last=False)
+
+    async def get_member(self, guild: discord.Guild, user_id: int):
+        """Returns a guild's member from the cache, or fetches it. Returns None if the user isn't in the guild."""
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.stats["cache_hits"] += 1
+            return member
+
+        key, now = (guild.id, user_id), time.monotonic()
+        expires_at, member = self._fetched.get(key, (0, None))
+        if expires_at > now:
+            self._fetched.move_to_end(key)
+            self.stats["fetched_hits"] += 1
+            return member
+        if self._absent.get(key, 0) > now:
+            self.stats["absent_hits"] += 1
+            return None
+
+        async with self._fetch_limit:
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                member = None
+                self.stats["not_found"] += 1
+        self.stats["fetches"] += 1
+        if member is None:
+            self._remember_absent(key)
+        else:
+            self._remember(key, member)
+        return member
+
+    async def ensure_chunked(self, guild: discord.Guild) -> None:
+        """Makes sure every member of a guild is cached, for things like `role.members`. Does nothing under the
+minimal policy, where only fetched members are available, so `role.members` stays empty there."""
+        if self.name != "lazy" or guild.chunked:
+            return
+        task = self._chunking.get(guild.id)
+        if task is None:
+            task = self._chunking[guild.id] = asyncio.ensure_future(guild.chunk())
+            task.add_done_callback(lambda _: self._chunking.pop(guild.id, None))
+        await task
+
+    async def mutual_guilds(self, user_id: int, guilds: list = None) -> list:
+        """Returns every guild shared with a user, out of `guilds` if given. Guilds whose members aren't all cached
+are checked one by one through `get_member`, so each is fetched at most once per `fetched_ttl` for a user. Callers
+should pass only the guilds they need, since that's up to one request per guild."""
+        if self.name == "full":
+            shared = self.bot.mutual_guilds.guilds(user_id)
+            return shared if guilds is None else [guild for guild in shared if guild in guilds]
+        known = self.bot.mutual_guilds.guild_ids(user_id)
+        found, unknown = [], []
+        for guild in self.bot.guilds if guilds is None else guilds:
+            if guild.id in known or guild.get_member(user_id) is not None:
+                found.append(guild)
+            elif not guild.chunked:
+                unknown.append(guild)
+        members = await asyncio.gather(*(self.get_member(guild, user_id) for guild in unknown))
+        return found + [member.guild for member in members if member is not None]
+
+    def report(self) -> list:
+        """Returns lines describing the member cache and an estimate of its size under each policy"""
+        guilds = self.bot.guilds
+        cached = [member for guild in guilds for member in guild.members]
+        total = sum(guild.member_count or 0 for guild in guilds)
+        sample = cached[:200]
+        seen = set()
+        per_member = sum(_size(member, seen) for member in sample) / len(sample) if sample else 0
+        chunked_members = sum(guild.member_count or 0 for guild in guilds if guild.chunked)
+
+        return [
+            f"Policy: `{self.name}`",
+            f"Resident memory: `{format_bytes(resident_memory())}`",
+            f"Members cached: `{len(cached):,}` of `{total:,}` (about `{format_bytes(per_member)}` each)",
+            f"Guilds chunked: `{sum(guild.chunked for guild in guilds)}` of `{len(guilds)}`",
+            f"Fetched members kept: `{len(self._fetched)}` of `{self.max_fetched}`, "
+            f"absent users kept: `{len(self._absent)}` of `{self.max_absent}`, stats: "
+            + ", ".join(f"{name} `{value}`" for name, value in self.stats.items()),
+            "",
+            "Estimated member cache at each policy:",
+            f"full: `{format_bytes(total * per_member)}`",
+            f"lazy: `{format_bytes(chunked_members * per_member)}` with the guilds chunked so far",
+            f"minimal: at most `{format_bytes(self.max_fetched * per_member)}`",
+        ]
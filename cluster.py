@@ -0,0 +1,331 @@
+"""Runs the bot as several worker processes, each connected to its own range of shards.
+
+Start a cluster (the shard count defaults to the one Discord recommends):
+    python cluster.py <workers> [shards]
+
+The supervisor started by this script restarts workers that exit and relays requests between them over a local
+socket, so a worker can ask about guilds on shards it isn't connected to. Workers talk to it through `Cluster`,
+which is also used when the bot runs as a single process (`python main.py`) so cogs don't need to know the difference.
+"""
+# Other Imports
+from urllib.request import Request, urlopen
+import itertools
+import secrets
+import asyncio
+import signal
+import struct
+import json
+import sys
+import os
+
+DISCORD_API = "https://discord.com/api/v9"
+IDENTIFY_INTERVAL = 5.0  # Discord allows one IDENTIFY every 5 seconds
+
+
+class ClusterError(Exception):
+    """A request to another worker failed, or no worker could answer it"""
+
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def shard_ranges(shard_count: int, workers: int) -> list:
+    """Splits the shards into one contiguous range per worker, as even as possible"""
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for worker_id in range(workers):
+        end = start + size + (worker_id < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+# Messages are length-prefixed json objects
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    data = json.dumps(message).encode("utf-8")
+    writer.write(struct.pack(">I", len(data)) + data)
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader) -> dict:
+    size, = struct.unpack(">I", await reader.readexactly(4))
+    return json.loads(await reader.readexactly(size))
+
+
+class Cluster:
+    """A worker's connection to the rest of the cluster.
+
+Cogs register handlers by name with `add_handler`, other workers call them with `request` (one worker) or
+`request_all` (every worker, this one included). Arguments and results must be json serializable. Without an
+`address` the bot is the whole cluster and requests are answered by its own handlers."""
+    def __init__(self, *, worker_id: int = 0, workers: int = 1, shard_count: int = 1, address: str = None,
+                 authkey: str = None, timeout: float = 5.0):
+        self.worker_id = worker_id
+        self.shard_count = shard_count
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._shard_workers = {shard_id: worker for worker, shard_ids in enumerate(shard_ranges(shard_count, workers))
+                               for shard_id in shard_ids}
+        self._handlers = {}
+        self._pending = {}  # request id -> future of the response
+        self._ids = itertools.count()
+        self._reader = self._writer = None
+        self._read_task = None
+
+    @classmethod
+    def from_environment(cls, environ) -> "Cluster":
+        """Creates the cluster for a worker started by the supervisor, or a single process cluster otherwise"""
+        if "CLUSTER_ADDRESS" not in environ:
+            return cls()
+        return cls(worker_id=int(environ["CLUSTER_WORKER"]), workers=int(environ["CLUSTER_WORKERS"]),
+                   shard_count=int(environ["SHARD_COUNT"]), address=environ["CLUSTER_ADDRESS"],
+                   authkey=environ["CLUSTER_AUTHKEY"])
+
+    @property
+    def shard_ids(self) -> list:
+        return [shard_id for shard_id, worker in self._shard_workers.items() if worker == self.worker_id]
+
+    @property
+    def runs_every_shard(self) -> bool:
+        """Whether this worker is connected to every shard, so it can see every guild's channels"""
+        return len(self.shard_ids) == self.shard_count
+
+    def worker_for_shard(self, shard_id: int) -> int:
+        return self._shard_workers[shard_id]
+
+    def worker_for(self, guild_id: int) -> int:
+        """Returns the id of the worker connected to the shard a guild is on"""
+        return self._shard_workers[shard_for(guild_id, self.shard_count)]
+
+    def add_handler(self, name: str, func) -> None:
+        self._handlers[name] = func
+
+    def remove_handler(self, name: str) -> None:
+        self._handlers.pop(name, None)
+
+    async def start(self) -> None:
+        if self.address is None:
+            return
+        host, port = self.address.rsplit(":", 1)
+        self._reader, self._writer = await asyncio.open_connection(host, int(port))
+        await _send(self._writer, {"op": "hello", "worker": self.worker_id, "authkey": self.authkey})
+        self._read_task = asyncio.ensure_future(self._read())
+
+    async def close(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def request(self, name: str, *args, worker: int):
+        """Calls a handler on one worker and returns its result, raises ClusterError if it fails"""
+        results = await self._request(name, args, worker)
+        if not results:
+            raise ClusterError(f"Worker {worker} didn't answer {name!r}")
+        if "error" in results[0]:
+            raise ClusterError(results[0]["error"])
+        return results[0]["result"]
+
+    async def request_all(self, name: str, *args) -> list:
+        """Calls a handler on every worker, returns the results of those that answered"""
+        return [result["result"] for result in await self._request(name, args, None) if "result" in result]
+
+    async def _request(self, name: str, args: tuple, worker) -> list:
+        if self.address is None:
+            return [await self._call(name, args)] if worker in (None, self.worker_id) else []
+        if self._writer is None:
+            raise ClusterError("Not connected to the cluster")
+
+        request_id = next(self._ids)
+        future = self._pending[request_id] = asyncio.get_event_loop().create_future()
+        try:
+            await _send(self._writer, {"op": "request", "id": request_id, "name": name, "args": args,
+                                       "worker": worker})
+            return await asyncio.wait_for(future, self.timeout * 2)
+        except asyncio.TimeoutError:
+            raise ClusterError(f"Timed out waiting for {name!r}") from None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _call(self, name: str, args) -> dict:
+        handler = self._handlers.get(name)
+        if handler is None:
+            return {"worker": self.worker_id, "error": f"No handler for {name!r}"}
+        try:
+            return {"worker": self.worker_id, "result": await handler(*args)}
+        except Exception as e:
+            return {"worker": self.worker_id, "error": f"{type(e).__name__}: {e}"}
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                message = await _receive(self._reader)
+                if message["op"] == "request":
+                    asyncio.ensure_future(self._answer(message))
+                elif message["op"] == "response":
+                    future = self._pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message["results"])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The supervisor is gone, so this worker would be orphaned
+            print("Lost the connection to the cluster supervisor, exiting")
+            os._exit(1)
+
+    async def _answer(self, message: dict) -> None:
+        result = await self._call(message["name"], message["args"])
+        await _send(self._writer, {"op": "response", "id": message["id"], **result})
+
+
+class Broker:
+    """Relays requests between workers, runs in the supervisor"""
+    def __init__(self, authkey: str, timeout: float = 5.0):
+        self.authkey = authkey
+        self.timeout = timeout
+        self._workers = {}  # worker id -> stream writer
+        self._pending = {}  # forwarded request id -> future of the response
+        self._ids = itertools.count()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello = await _receive(reader)
+        except (asyncio.IncompleteReadError, ValueError, ConnectionError):
+            writer.close()
+            return
+        if hello.get("op") != "hello" or not secrets.compare_digest(str(hello.get("authkey")), self.authkey):
+            writer.close()
+            return
+
+        worker_id = hello["worker"]
+        self._workers[worker_id] = writer
+        try:
+            while True:
+                message = await _receive(reader)
+                if message["op"] == "request":
+                    asyncio.ensure_future(self._route(writer, message))
+                elif message["op"] == "response":
+                    future = self._pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self._workers.get(worker_id) is writer:
+                del self._workers[worker_id]
+            writer.close()
+
+    async def _route(self, writer: asyncio.StreamWriter, message: dict) -> None:
+        targets = list(self._workers) if message["worker"] is None else [message["worker"]]
+        responses = await asyncio.gather(*(self._forward(target, message) for target in targets))
+        try:
+            await _send(writer, {"op": "response", "id": message["id"],
+                                 "results": [response for response in responses if response is not None]})
+        except ConnectionError:
+            pass
+
+    async def _forward(self, worker_id: int, message: dict):
+        """Sends a request to a worker and returns its response, or None if it's down or too slow"""
+        writer = self._workers.get(worker_id)
+        if writer is None:
+            return None
+        forward_id = next(self._ids)
+        future = self._pending[forward_id] = asyncio.get_event_loop().create_future()
+        try:
+            await _send(writer, {"op": "request", "id": forward_id, "name": message["name"], "args": message["args"]})
+            response = await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            return None
+        finally:
+            self._pending.pop(forward_id, None)
+        return {key: value for key, value in response.items() if key in ("worker", "result", "error")}
+
+
+class Supervisor:
+    """Starts a worker process per range of shards and restarts any that exit, waiting longer after each crash"""
+    def __init__(self, workers: int, shard_count: int, *, web_port: int = 8080, restart_delay: float = 5.0,
+                 max_restart_delay: float = 300.0):
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.web_port = web_port
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.authkey = secrets.token_hex(32)
+        self.broker = Broker(self.authkey)
+        self._processes = {}
+        self._stopping = False
+
+    async def run(self) -> None:
+        server = await asyncio.start_server(self.broker.handle, "127.0.0.1", 0)
+        address = "127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                pass
+
+        # Workers are started one after another, as shards have to identify one at a time anyway
+        start_delays = itertools.accumulate([0] + [len(shard_ids) * IDENTIFY_INTERVAL for shard_ids in self.ranges])
+        await asyncio.gather(*(self._keep_running(worker_id, shard_ids, address, delay)
+                               for (worker_id, shard_ids), delay in zip(enumerate(self.ranges), start_delays)))
+        server.close()
+
+    def stop(self) -> None:
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def _keep_running(self, worker_id: int, shard_ids: list, address: str, start_delay: float) -> None:
+        await asyncio.sleep(start_delay)
+        env = {
+            **os.environ,
+            "CLUSTER_WORKER": str(worker_id),
+            "CLUSTER_WORKERS": str(len(self.ranges)),
+            "CLUSTER_ADDRESS": address,
+            "CLUSTER_AUTHKEY": self.authkey,
+            "SHARD_COUNT": str(self.shard_count),
+            "PORT": str(self.web_port + worker_id),
+        }
+        delay = self.restart_delay
+        loop = asyncio.get_event_loop()
+        while not self._stopping:
+            started_at = loop.time()
+            process = self._processes[worker_id] = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), env=env)
+            print(f"Started worker {worker_id} (shards {shard_ids[0]}-{shard_ids[-1]}), pid {process.pid}")
+            return_code = await process.wait()
+            if self._stopping:
+                break
+            if loop.time() - started_at > self.max_restart_delay:
+                delay = self.restart_delay  # It ran fine for a while, so this isn't a crash loop
+            print(f"Worker {worker_id} exited with code {return_code}, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+
+def recommended_shards(token: str) -> int:
+    request = Request(f"{DISCORD_API}/gateway/bot", headers={"Authorization": f"Bot {token}",
+                                                             "User-Agent": "Robo-Dart (Discord Bot)"})
+    with urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def main() -> None:
+    if len(sys.argv) not in (2, 3) or not all(arg.isdigit() for arg in sys.argv[1:]):
+        print(__doc__)
+        return
+    from main import get_token
+
+    workers = int(sys.argv[1])
+    shard_count = int(sys.argv[2]) if len(sys.argv) == 3 else recommended_shards(get_token())
+    workers = max(1, min(workers, shard_count))
+    print(f"Running {shard_count} shards over {workers} workers")
+    supervisor = Supervisor(workers, shard_count, web_port=int(os.environ.get("PORT", 8080)))
+    asyncio.get_event_loop().run_until_complete(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,11 @@ import textwrap
 import io
 
 # Other Imports
-from utils import StatusType
+from utils import StatusType, LogReader
+from datetime import datetime, timedelta
+from functools import partial
+from outbox import Priority
+import asyncio
 
 
 def cleanup_code(content) -> str:
@@ -19,11 +23,31 @@ def cleanup_code(content) -> str:
         return "\n".join(content.split("\n")[1:-1])
 
 
+def parse_time(value: str) -> datetime:
+    """Converts how long ago something was (30m, 2h, 1d) or a date/time (2022-05-14T18:00) to a datetime"""
+    units = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+    if value[:-1].isdigit() and value[-1].lower() in units:
+        return datetime.now() - timedelta(seconds=int(value[:-1]) * units[value[-1].lower()])
+    return datetime.fromisoformat(value)
+
+
 class AdminOnly(commands.Cog):
     """Admin Only commands, only meant to be used by the bot author"""
     def __init__(self, bot):
         self.bot = bot
         self._last_result = None
+        bot.cluster.add_handler("notify_owner", self.notify_owner)
+
+    def cog_unload(self):
+        self.bot.cluster.remove_handler("notify_owner")
+
+    async def notify_owner(self, message: str) -> None:
+        owner = self.bot.get_user(self.bot.owner_id) or await self.bot.fetch_user(self.bot.owner_id)
+        await owner.send(message)
+
+    async def send_to_owner(self, message: str) -> None:
+        """DMs the owner from the worker on shard 0, which DMs are sent to so the owner's DM channel is cached there"""
+        await self.bot.cluster.request("notify_owner", message, worker=self.bot.cluster.worker_for_shard(0))
 
     @commands.command(hidden=True)
     @commands.is_owner()
@@ -80,20 +104,76 @@ class AdminOnly(commands.Cog):
     async def say(self, ctx, channels: Greedy[discord.TextChannel] = None, *, message: str):
         """Basic say command, sends the message as a regular message"""
         await ctx.message.delete()
-        [await channel.send(message) for channel in channels or [ctx.channel]]
+        await asyncio.gather(*(self.bot.outbox.send(channel, message, priority=Priority.BULK)
+                               for channel in channels or [ctx.channel]))
+
+    async def send_log_entries(self, ctx, **filters):
+        """Sends the log entries matching the given filters, split over as many messages as needed (at most 10)"""
+        reader = LogReader(self.bot.logger.file_dir)
+        entries = await self.bot.loop.run_in_executor(None, partial(reader.read, **filters))
+        if not entries:
+            await ctx.send("No log entries found.")
+            return
+
+        pages, page = [], ""
+        for entry in reversed(entries):
+            text = str(entry).replace("```", "`\u200b``")[:1900] + "\n"
+            if len(page) + len(text) > 1900:
+                pages.append(page)
+                page = ""
+            page += text
+        pages.append(page)
+        for page in pages[-10:]:
+            await ctx.send(f"```\n{page}```")
+
+    @commands.group(
+        name="logs",
+        hidden=True,
+        invoke_without_command=True
+    )
+    @commands.is_owner()
+    async def logs(self, ctx, limit: int = 20):
+        """Shows the newest entries of the bot log"""
+        await self.send_log_entries(ctx, limit=limit)
+
+    @logs.command(
+        name="search",
+        hidden=True
+    )
+    @commands.is_owner()
+    async def logs_search(self, ctx, status: str = "all", since: str = None, until: str = None, limit: int = 20):
+        """Shows the newest log entries with a status (error, warning, ok or all) between two times.
+Times can be how long ago (30m, 2h, 1d) or a date/time (2022-05-14 or 2022-05-14T18:00)"""
+        try:
+            statuses = None if status.lower() == "all" else {StatusType[status.upper()]}
+            since = parse_time(since) if since is not None else None
+            until = parse_time(until) if until is not None else None
+        except (KeyError, ValueError) as e:
+            await ctx.send(f"Couldn't understand `{e.args[0]}`, check `{ctx.prefix}help logs search`.")
+            return
+        await self.send_log_entries(ctx, limit=limit, statuses=statuses, since=since, until=until)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def memory(self, ctx):
+        """Shows how much memory the member cache takes up, and would take up under each cache policy"""
+        embed = discord.Embed(
+            title="Member Cache",
+            description="\n".join(self.bot.cache_policy.report()),
+            color=self.bot.EMBED_COLOR
+        )
+        await ctx.send(embed=embed)
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        owner = self.bot.get_user(self.bot.owner_id)
         message = f"{self.bot.user.name} was just added to {guild.name!r}! Guild ID: `{guild.id}`"
-        await owner.send(message)
+        await self.send_to_owner(message)
         self.bot.logger.write(status=StatusType.OK, message=message)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
-        owner = self.bot.get_user(self.bot.owner_id)
         message = f"{self.bot.user.name} was just removed from {guild.name!r}! Guild ID: `{guild.id}`"
-        await owner.send(message)
+        await self.send_to_owner(message)
         self.bot.logger.write(status=StatusType.OK, message=message)
 
 
@@ -5,70 +5,125 @@ import discord
 from discord.ext import commands
 
 # Other Imports
-import json
+from collections import namedtuple
+
+from conversations import NameIndex, Session, SessionAlreadyOpen, SessionLimitReached
+from utils import StatusType
+
+Choice = namedtuple("Choice", ("id", "name"))  # A guild or channel that might be on another worker
 
 
 class AnonChannelHandler:
-    def __init__(self, bot: commands.Bot, file_dir: str):
+    """Keeps every guild's anonymous channel ids in memory, which is the source of truth once loaded.
+Changes are saved to the store in batches by a debounced background flush."""
+    def __init__(self, bot: commands.Bot, flush_delay: float = 5.0):
         self.bot = bot
-        self.file_dir = file_dir
-        self._channels = self.load(file_dir)
-
-    @property
-    def vent_channels(self) -> dict:
-        return self._channels
-
-    def to_json(self) -> dict:
-        """Returns the self.vent_channels attribute as a json-valid object"""
-        json_object: dict = {}
-        for guild_id, channels in self._channels.items():
-            json_object[str(guild_id)] = [channel.id for channel in channels]
-        return json_object
-
-    def save(self) -> None:
-        """Saves the self.vent_channels attribute to the file path for the given instance"""
-        json_object = self.to_json()
-        with open(self.file_dir, "w") as f:
-            json.dump(json_object, f, indent=2)
-
-    def load(self, file_dir: str = None) -> dict:
-        """Loads the given file at the given file path and returns it as a dict of a guild id to a list of channels"""
-        if file_dir is None:
-            file_dir = self.file_dir
-        with open(file_dir, "r") as f:
-            saved_anon_data = json.load(f)
-
-        for guild_id, channels in saved_anon_data.items():
-            # Convert channel ids to discord.TextChannel objects
-            guild = self.bot.get_guild(int(guild_id))
-            saved_anon_data[guild_id] = [guild.get_channel(channel) for channel in channels]
-        self._channels = saved_anon_data
-        return saved_anon_data
+        self.flush_delay = flush_delay
+        self.loaded = False
+        self._channels = {}  # guild id -> set of channel ids
+        self._unsaved = {}   # (guild id, channel id) -> whether the channel was added (True) or removed (False)
+        self._saving = {}    # Changes being written by the current flush, in the same form as `_unsaved`
+        self._flush_task = None
+
+    async def load(self) -> None:
+        """Loads every saved channel from the snapshot if the store hasn't changed since, or from the store.
+Only the first call does anything."""
+        if self.loaded:
+            return
+        saved_anon_data = self.bot.snapshot.get("vent_channels", store_backed=True)
+        if saved_anon_data is None:
+            saved_anon_data = await self.bot.store.vent_channels.all()
+        self._channels = {int(guild_id): set(channel_ids) for guild_id, channel_ids in saved_anon_data.items()}
+        # Changes made before loading finished are newer than what was saved
+        for (guild_id, channel_id), added in {**self._saving, **self._unsaved}.items():
+            channel_ids = self._channels.setdefault(guild_id, set())
+            if added:
+                channel_ids.add(channel_id)
+            else:
+                channel_ids.discard(channel_id)
+                if not channel_ids:
+                    del self._channels[guild_id]
+        self.loaded = True
+
+    def dump(self):
+        """Returns the channels for the snapshot, or None while some changes haven't been saved to the store yet"""
+        if self._unsaved or not self.loaded:
+            return None
+        return {guild_id: sorted(channel_ids) for guild_id, channel_ids in self._channels.items()}
+
+    def __contains__(self, channel: discord.TextChannel) -> bool:
+        return channel.id in self._channels.get(channel.guild.id, ())
+
+    def guild_ids(self) -> list:
+        """Returns the ids of every guild with anonymous channels"""
+        return list(self._channels)
+
+    def channels_for(self, guild: discord.Guild) -> list:
+        """Returns all anonymous channels for a given guild that still exist"""
+        channels = [guild.get_channel(channel_id) for channel_id in self._channels.get(guild.id, ())]
+        return [channel for channel in channels if channel is not None]
 
     def add_channel(self, channel: discord.TextChannel) -> bool:
         """Adds a given channel to the list of anonymous channels for the channel's guild.
 Returns a bool of whether the channel was added or not"""
-        self.load()
-        channels = self._channels.get(str(channel.guild.id), [])
-        if channel not in channels:
-            channels.append(channel)
-            self._channels.update({str(channel.guild.id): channels})
-        self.save()
-        return channel in self._channels.get(str(channel.guild.id), [])
+        channel_ids = self._channels.setdefault(channel.guild.id, set())
+        if channel.id in channel_ids:
+            return False
+        channel_ids.add(channel.id)
+        self._mark_unsaved(channel, True)
+        return True
 
     def remove_channel(self, channel: discord.TextChannel) -> bool:
-        """Removes a given channel to the list of anonymous channels for the channel's guild.
+        """Removes a given channel from the list of anonymous channels for the channel's guild.
 Returns a bool of whether the channel was removed or not"""
-        self.load()
-        channels = self._channels.get(str(channel.guild.id), [])
-        if channel in channels:
-            channels.remove(channel)
-            if not channels:
-                del self._channels[str(channel.guild.id)]
-            else:
-                self._channels.update({str(channel.guild.id): channels})
-        self.save()
-        return channel in self._channels.get(str(channel.guild.id), [])
+        channel_ids = self._channels.get(channel.guild.id, set())
+        if channel.id not in channel_ids:
+            return False
+        channel_ids.remove(channel.id)
+        if not channel_ids:
+            del self._channels[channel.guild.id]
+        self._mark_unsaved(channel, False)
+        return True
+
+    def _mark_unsaved(self, channel: discord.TextChannel, added: bool) -> None:
+        self._unsaved[(channel.guild.id, channel.id)] = added
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self.bot.loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self.flush()
+        except Exception as e:
+            # Nothing awaits this task, so log the failure and try again, flush has already kept the changes
+            self.bot.logger.write(status=StatusType.WARNING,
+                                  message=f"Failed to save {len(self._unsaved)} anonymous channel changes, "
+                                          f"retrying in {self.flush_delay}s: {e!r}")
+            self._flush_task = self.bot.loop.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """Saves every unsaved change to the store in a single transaction"""
+        changes, self._unsaved = self._unsaved, {}
+        if not changes:
+            return
+        self._saving = changes
+        try:
+            await self.bot.store.run(self.bot.store.vent_channels.apply_changes, changes)
+        except Exception:
+            # Keep the changes for the next flush, unless they've been changed again since
+            self._unsaved = {**changes, **self._unsaved}
+            raise
+        finally:
+            self._saving = {}
+        self.bot.snapshot.mark_dirty()
+
+    def flush_now(self) -> None:
+        """Saves every unsaved change and waits for it to finish, used when shutting down"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        changes, self._unsaved = self._unsaved, {}
+        if changes:
+            self.bot.store.run_sync(self.bot.store.vent_channels.apply_changes, changes)
 
 
 def create_embed(message: str) -> discord.Embed:
@@ -86,11 +141,35 @@ class AnonymousConfessions(commands.Cog, name="Anonymous Confessions"):
 
     def __init__(self, bot):
         self.bot = bot
-        self.handler = None  # Temporary value, is updated in the on_ready listener
+        self.handler = AnonChannelHandler(bot)
+        bot.snapshot.register("vent_channels", self.handler.dump)
+        # DMs all arrive on shard 0, so guilds and channels on other shards are looked up through the cluster
+        bot.cluster.add_handler("confess.mutual_guilds", self.mutual_guilds)
+        bot.cluster.add_handler("confess.channels", self.anon_channels)
+        bot.cluster.add_handler("confess.send", self.send_confession)
 
     @commands.Cog.listener()
     async def on_ready(self):
-        self.handler = AnonChannelHandler(self.bot, f"{self.bot.BASE_DIR}/resources/vent_channels.json")
+        await self.handler.load()
+
+    def cog_unload(self):
+        for name in ("confess.mutual_guilds", "confess.channels", "confess.send"):
+            self.bot.cluster.remove_handler(name)
+        self.handler.flush_now()
+
+    # Cluster handlers, these only see the guilds on this worker's shards
+    async def mutual_guilds(self, user_id: int) -> list:
+        # Only guilds with anonymous channels can be sent to, so only those are checked for the user
+        guilds = [self.bot.get_guild(guild_id) for guild_id in self.handler.guild_ids()]
+        guilds = [guild for guild in guilds if guild is not None]
+        return [(guild.id, guild.name) for guild in await self.bot.cache_policy.mutual_guilds(user_id, guilds)]
+
+    async def anon_channels(self, guild_id: int) -> list:
+        guild = self.bot.get_guild(guild_id)
+        return [(channel.id, channel.name) for channel in self.handler.channels_for(guild)] if guild else []
+
+    async def send_confession(self, channel_id: int, message: str) -> None:
+        await self.bot.get_channel(channel_id).send(embed=create_embed(message))
 
     @commands.command(
         brief="...",
@@ -99,66 +178,68 @@ class AnonymousConfessions(commands.Cog, name="Anonymous Confessions"):
     )
     @commands.dm_only()
     async def anon_confess(self, ctx, *, message: str):
-        def check(m):
-            """Checks that a message is from the author and is in the same channel"""
-            return (m.author == ctx.author) and (m.channel == ctx.channel)
-
-        guilds = [guild for guild in self.bot.guilds if ctx.author in guild.members]
+        cluster = self.bot.cluster
+        guilds = [Choice(*guild) for guilds in await cluster.request_all("confess.mutual_guilds", ctx.author.id)
+                  for guild in guilds]
         guild_names = [f"`{guild.name}`""\n" for guild in guilds]
 
-        while True:
+        try:
+            session = self.bot.conversations.start(ctx.author.id, ctx.channel.id, after=ctx.message.id)
+        except SessionAlreadyOpen:
+            await ctx.send("You already have a message waiting to be sent, please finish or `cancel` it first!")
+            return
+        except SessionLimitReached:
+            await ctx.send("Lots of people are sending messages right now, please try again in a minute!")
+            return
+
+        with session:
             # Get the guild that the user would like to send the message to
             await ctx.send(f"""Here's a list of common servers between us, please select one to send your message to:
 {"".join(guild_names)}
 
 Or if you'd like to cancel your message, type `cancel`.""")
-
-            try:
-                chosen_guild = await self.bot.wait_for("message", check=check, timeout=30.0)
-                if chosen_guild.content.lower() == "cancel":
-                    await ctx.send("Cancelling message...")
-                    return
-
-                chosen_guild = discord.utils.get(guilds, name=chosen_guild.content)
-                if chosen_guild is not None:
-                    break
-                else:
-                    await ctx.send(f"Couldn't convert value to a server, "
-                                   "make sure that the server name is spelled correctly.")
-                    continue
-
-            except asyncio.TimeoutError:
-                await ctx.send("Your message has timed out, please try again!")
+            chosen_guild = await self.choose(ctx, session, NameIndex(guilds), "server")
+            if chosen_guild is None:
                 return
-        await ctx.send(f"Selected {chosen_guild.name}!")
+            await ctx.send(f"Selected {chosen_guild.name}!")
 
-        channels = self.handler.vent_channels[str(chosen_guild.id)]
-        channel_names = [f"`{channel.name}`""\n" for channel in channels]
+            worker = cluster.worker_for(chosen_guild.id)
+            channels = [Choice(*channel) for channel in
+                        await cluster.request("confess.channels", chosen_guild.id, worker=worker)]
+            channel_names = [f"`{channel.name}`""\n" for channel in channels]
 
-        await ctx.send(f"""Your message has been received, where would you like to send it to?
+            await ctx.send(f"""Your message has been received, where would you like to send it to?
 {"".join(channel_names)}
 Or if you'd like to cancel your message, type `cancel`.""")
+            chosen_channel = await self.choose(ctx, session, NameIndex(channels), "channel")
+            if chosen_channel is None:
+                return
+
+        await cluster.request("confess.send", chosen_channel.id, message, worker=worker)
+
+    @staticmethod
+    async def choose(ctx, session: Session, index: NameIndex, kind: str):
+        """Waits for the user to pick an object from the index by name (or the start of its name).
+Returns None if they cancel or don't reply in time."""
         while True:
             try:
-                chosen_channel = await self.bot.wait_for("message", check=check, timeout=30.0)
-                if chosen_channel.content.lower() == "cancel":
-                    await ctx.send("Cancelling message...")
-                    return
-
-                chosen_channel = discord.utils.get(chosen_guild.text_channels, name=chosen_channel.content)
-                if chosen_channel is not None:
-                    break
-                else:
-                    await ctx.send(f"Couldn't convert value to a channel, "
-                                   "make sure that the channel name is spelled correctly.")
-                    continue
-
+                reply = await session.next_message(timeout=30.0)
             except asyncio.TimeoutError:
                 await ctx.send("Your message has timed out, please try again!")
-                return
+                return None
+
+            if reply.content.lower() == "cancel":
+                await ctx.send("Cancelling message...")
+                return None
 
-        embed = create_embed(message)
-        await chosen_channel.send(embed=embed)
+            matches = index.find(reply.content)
+            if len(matches) == 1:
+                return matches[0]
+            elif matches:
+                await ctx.send(f"More than one {kind} starts with that, please type more of the name.")
+            else:
+                await ctx.send(f"Couldn't convert value to a {kind}, "
+                               f"make sure that the {kind} name is spelled correctly.")
 
     @anon_confess.error
     async def on_confess_error(self, ctx, error):
@@ -180,10 +261,8 @@ Or if you'd like to cancel your message, type `cancel`.""")
     @commands.has_permissions(manage_channels=True)
     async def channel(self, ctx):
         """The base command for the group, which will only send the help page for the group itself (WIP)"""
-        listed_channels = self.handler.vent_channels.get(
-            str(ctx.guild.id)
-        )
-        if listed_channels is None:
+        listed_channels = self.handler.channels_for(ctx.guild)
+        if not listed_channels:
             # No channels saved for the current server
             await ctx.send(f"""There aren't any channels set up to be anonymous for **{ctx.guild.name}**.
 You can add channels using `{ctx.prefix}channel add #channel`, where `#channel` is a channel mention!""")
@@ -7,10 +7,25 @@ class HubOnly(commands.Cog):
     """Emoji Hub Only Commands/Listeners"""
     def __init__(self, bot):
         self.bot = bot
-    
+        bot.snapshot.register("emojis", self.dump_emojis)
+        if not hasattr(bot, "cust_emojis"):
+            # Usable straight away, even on workers that aren't connected to the Emoji Hub's shard
+            saved_emojis = bot.snapshot.get("emojis") or {}
+            bot.cust_emojis = {name: discord.PartialEmoji(name=name, id=emoji_id, animated=animated)
+                               for name, (emoji_id, animated) in saved_emojis.items()}
+
+    def dump_emojis(self) -> dict:
+        return {name: [emoji.id, emoji.animated] for name, emoji in self.bot.cust_emojis.items()}
+
     def reload_emojis(self):
         """Load all custom emojis from the Emoji Hub server to a dictionary"""
-        self.bot.cust_emojis = {emoji.name: emoji for emoji in self.bot.get_guild(903452394204065833).emojis}
+        guild = self.bot.get_guild(903452394204065833)
+        if guild is None:
+            return  # Not on one of this bot's shards, keep the emojis from the snapshot
+        emojis = {emoji.name: emoji for emoji in guild.emojis}
+        if self.dump_emojis() != {name: [emoji.id, emoji.animated] for name, emoji in emojis.items()}:
+            self.bot.snapshot.mark_dirty()
+        self.bot.cust_emojis = emojis
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -7,6 +7,8 @@ from datetime import datetime
 
 # Emojis Imports
 from random import randint, random
+from outbox import Priority
+import asyncio
 
 
 def timestamp(time, mode="F"):
@@ -40,7 +42,7 @@ class BotInfo(commands.Cog, name="Information"):
         aliases=["author"]
     )
     async def author_info(self, ctx):
-        author = self.bot.get_user(self.bot.owner_id)
+        author = self.bot.get_user(self.bot.owner_id) or await self.bot.fetch_user(self.bot.owner_id)
         author_info = {
             "Name": {"text": author.name, "inline": True},
             "Discord Account": {"text": author, "inline": True},
@@ -77,6 +79,10 @@ class BotInfo(commands.Cog, name="Information"):
         start_time = datetime.utcnow()
         async with ctx.channel.typing():
             user = user or ctx.author  # Get the user's profile if no member is passed
+            if self.bot.intents.presences and ctx.guild.get_member(user.id) is None:
+                # Not kept by the cache policy, so ask the gateway for their presence
+                members = await ctx.guild.query_members(user_ids=[user.id], presences=True, cache=False)
+                user = members[0] if members else user
             status_dict = {
                 discord.Status.online: self.bot.cust_emojis["status_online"],
                 discord.Status.idle: self.bot.cust_emojis["status_idle"],
@@ -94,15 +100,15 @@ class BotInfo(commands.Cog, name="Information"):
                 ],
                 "Server Info": [
                     f"{self.bot.cust_emojis['member_join']} Joined At: {timestamp(user.joined_at)} - {timestamp(user.joined_at, 'R')}",
-                    f"{self.bot.cust_emojis['owner']} Server Owner: {self.bot.cust_emojis['green_tick'] if user == ctx.guild.owner else self.bot.cust_emojis['red_tick']}",
-                    f"{self.bot.cust_emojis['booster']} Server Booster: {self.bot.cust_emojis['green_tick'] if user in ctx.guild.premium_subscribers else self.bot.cust_emojis['red_tick']}",
+                    f"{self.bot.cust_emojis['owner']} Server Owner: {self.bot.cust_emojis['green_tick'] if user.id == ctx.guild.owner_id else self.bot.cust_emojis['red_tick']}",
+                    f"{self.bot.cust_emojis['booster']} Server Booster: {self.bot.cust_emojis['green_tick'] if user.premium_since is not None else self.bot.cust_emojis['red_tick']}",
                     f"{self.bot.cust_emojis['mention']} Top Role: {user.top_role.mention}"
                 ],
                 "Status Info": [
                     f"🖥️ Desktop: {status_dict[user.desktop_status]}",
                     f"🕸️ Web: {status_dict[user.web_status]}",
                     f"📱 Mobile: {status_dict[user.mobile_status]}",
-                ]
+                ] if self.bot.intents.presences else ["Statuses aren't available with the current cache policy"]
             }
             user_embed = discord.Embed(color=self.bot.EMBED_COLOR, timestamp=datetime.utcnow())
             user_embed.set_thumbnail(url=user.avatar_url)
@@ -153,7 +159,9 @@ class BotInfo(commands.Cog, name="Information"):
     async def emotes(self, ctx):
         if ctx.guild.id == 903452394204065833:
             await ctx.message.delete()
-            [await ctx.send(f"{emoji} -- `{emoji}`\n") for emoji in self.bot.cust_emojis.values()]
+            # Queued together so they're batched into as few messages as fit
+            await asyncio.gather(*(self.bot.outbox.send(ctx.channel, f"{emoji} -- `{emoji}`", priority=Priority.BULK,
+                                                        batch=True) for emoji in self.bot.cust_emojis.values()))
             
         else:
             embed = discord.Embed(
@@ -6,6 +6,7 @@ from discord.ext.commands import Greedy
 
 # Other Imports
 from datetime import datetime
+from outbox import Priority
 
 
 def create_embed(ctx, message) -> discord.Embed:
@@ -32,7 +33,11 @@ class ModOnly(commands.Cog, name="Moderation"):
     @has_permissions(kick_members=True)
     async def kick(self, ctx, members: Greedy[discord.Member], *, reason: str = None):
         if not members:
-            await ctx.send("Make sure to include at least one member when running the command.")
+            await self.bot.outbox.send(
+                ctx.channel,
+                "Make sure to include at least one member when running the command.",
+                priority=Priority.MODERATION
+            )
             return
         [await member.kick(reason=reason) for member in members]
         kicked_members = "".join([f"- {member.mention}\n" for member in members])
@@ -42,7 +47,7 @@ class ModOnly(commands.Cog, name="Moderation"):
             f"\n {kicked_members} for: \n> {reason or 'No reason given.'}"
         )
         embed.set_footer(text=f"Action performed by {ctx.author}")
-        await ctx.send(embed=embed)
+        await self.bot.outbox.send(ctx.channel, embed=embed, priority=Priority.MODERATION)
 
     @commands.command(
         brief="Bans a member.",
@@ -52,7 +57,11 @@ class ModOnly(commands.Cog, name="Moderation"):
     @has_permissions(ban_members=True)
     async def ban(self, ctx, members: Greedy[discord.Member], *, reason: str = None):
         if not members:
-            await ctx.send("Make sure to include at least one member when running the command.")
+            await self.bot.outbox.send(
+                ctx.channel,
+                "Make sure to include at least one member when running the command.",
+                priority=Priority.MODERATION
+            )
             return
         [await member.ban(reason=reason) for member in members]
         banned_members = "".join([f"- {member.mention}\n" for member in members])
@@ -61,7 +70,7 @@ class ModOnly(commands.Cog, name="Moderation"):
             f"The following members have been banned from {ctx.guild.name}:"
             f"\n {banned_members} for: \n> {reason or 'No reason given.'}"
         )
-        await ctx.send(embed=embed)
+        await self.bot.outbox.send(ctx.channel, embed=embed, priority=Priority.MODERATION)
 
     @commands.command(
         brief="Unbans a member.",
@@ -71,7 +80,11 @@ class ModOnly(commands.Cog, name="Moderation"):
     @has_permissions(ban_members=True)
     async def unban(self, ctx, members: Greedy[discord.Member], *, reason: str = None):
         if not members:
-            await ctx.send("Make sure to include at least one member when running the command.")
+            await self.bot.outbox.send(
+                ctx.channel,
+                "Make sure to include at least one member when running the command.",
+                priority=Priority.MODERATION
+            )
             return
         [await member.unban(reason=reason) for member in members]
         unbanned_members = "".join([f"- {member.mention}\n" for member in members])
@@ -80,7 +93,7 @@ class ModOnly(commands.Cog, name="Moderation"):
             f"The following members have been unbanned from {ctx.guild.name}:"
             f"\n {unbanned_members} for: \n> {reason or 'No reason given.'}"
         )
-        await ctx.send(embed=embed)
+        await self.bot.outbox.send(ctx.channel, embed=embed, priority=Priority.MODERATION)
 
     @commands.command(
         brief="Either deletes a certain number of messages or deletes messages until a certain message is reached.",
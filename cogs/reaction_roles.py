@@ -1,63 +1,412 @@
 # Discord Imports
+import asyncio
+
 import discord
 from discord.ext import commands
 from discord.ext.commands import Greedy
 
 # Other Imports
 from utils import StatusType
-from emoji import emojize
-from json import load, dump
-from os import chdir
+from collections import Counter
+from typing import Optional
+import time
 
 
 class ChannelNotFound(Exception):
     ...
 
 
+def emojize(text: str) -> str:
+    """`emoji.emojize`, emoji is slow to import so it's only imported once a menu is loaded or made"""
+    from emoji import emojize as emoji_emojize
+    return emoji_emojize(text)
+
+
+def emoji_key(emoji) -> str:
+    """Returns the key a reaction's emoji (a str, Emoji or PartialEmoji) is saved under in a role menu"""
+    if isinstance(emoji, str):
+        return emoji
+    if emoji.id is not None:
+        return f"<:{emoji.name}:{emoji.id}>"
+    return emoji.name
+
+
+def menu_id(argument: str) -> tuple:
+    """Converts a menu's `channel id-message id`, or only its message id, to (channel id or None, message id)"""
+    channel_id, _, message_id = argument.strip().rpartition("-")
+    try:
+        return int(channel_id) if channel_id else None, int(message_id)
+    except ValueError:
+        raise commands.BadArgument(f"{argument!r} isn't a role menu id, expected `channel id-message id` or a "
+                                   f"message id") from None
+
+
+class RoleMenu:
+    """A single role menu, saved only as plain ids"""
+    __slots__ = ("guild_id", "channel_id", "message_id", "roles")
+
+    def __init__(self, guild_id: int, channel_id: int, message_id: int, roles: dict):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.roles = roles  # emoji -> role id
+
+    @property
+    def full_id(self) -> str:
+        return f"{self.channel_id}-{self.message_id}"
+
+
+class RoleMenuRegistry:
+    """Every loaded role menu, keyed by message id so reaction events only need a single dict lookup"""
+    def __init__(self):
+        self._menus = {}
+
+    def __len__(self) -> int:
+        return len(self._menus)
+
+    def __iter__(self):
+        return iter(self._menus.values())
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._menus
+
+    def get(self, message_id: int, guild_id: int = None) -> RoleMenu:
+        """Returns the menu for a given message id, or None if there isn't one (or it belongs to another guild)"""
+        menu = self._menus.get(message_id)
+        if menu is not None and guild_id is not None and menu.guild_id != guild_id:
+            return None
+        return menu
+
+    def add(self, menu: RoleMenu) -> None:
+        self._menus[menu.message_id] = menu
+
+    def remove(self, message_id: int) -> RoleMenu:
+        """Removes and returns the menu for a given message id, or None if there wasn't one"""
+        return self._menus.pop(message_id, None)
+
+    def clear(self) -> None:
+        self._menus.clear()
+
+
+class RoleEditBuffer:
+    """Collects the role changes for each member over a short window and applies them with a single edit"""
+    def __init__(self, bot: commands.Bot, delay: float = 1.0):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}  # (guild id, member id) -> [role ids to add, role ids to remove, number of changes]
+        self._tasks = {}
+        self.stats = {"changes": 0, "edits": 0, "coalesced": 0, "skipped": 0, "failed": 0}
+
+    def add_role(self, member: discord.Member, role_id: int) -> None:
+        self._queue(member, role_id, add=True)
+
+    def remove_role(self, member: discord.Member, role_id: int) -> None:
+        self._queue(member, role_id, add=False)
+
+    def _queue(self, member: discord.Member, role_id: int, *, add: bool) -> None:
+        key = (member.guild.id, member.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = [set(), set(), 0]
+            self._tasks[key] = self.bot.loop.create_task(self._flush_later(key))
+
+        to_add, to_remove = pending[0], pending[1]
+        if add:
+            to_add.add(role_id)
+            to_remove.discard(role_id)
+        else:
+            to_remove.add(role_id)
+            to_add.discard(role_id)
+        pending[2] += 1
+        self.stats["changes"] += 1
+
+    async def _flush_later(self, key: tuple) -> None:
+        await asyncio.sleep(self.delay)
+        await self.flush(key)
+
+    async def flush(self, key: tuple) -> None:
+        """Applies every pending change for a (guild id, member id) pair in one request"""
+        self._tasks.pop(key, None)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        to_add, to_remove, num_changes = pending
+
+        guild = self.bot.get_guild(key[0])
+        member = await self.bot.cache_policy.get_member(guild, key[1]) if guild is not None else None
+        if member is None:
+            # Member left before the changes were applied
+            self.stats["skipped"] += num_changes
+            return
+
+        current_roles = {role.id for role in member.roles if not role.is_default()}
+        new_roles = (current_roles | to_add) - to_remove
+        if new_roles == current_roles:
+            self.stats["skipped"] += num_changes
+            return
+
+        try:
+            await member.edit(roles=[discord.Object(id=role_id) for role_id in new_roles])
+        except discord.HTTPException:
+            self.stats["failed"] += 1
+        else:
+            self.bot.cache_policy.forget(guild.id, member.id)
+            self.stats["edits"] += 1
+            self.stats["coalesced"] += num_changes - 1
+
+    def cancel(self) -> None:
+        """Drops every pending change without applying it"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._pending.clear()
+
+
+class MenuReconciler:
+    """Brings role membership back in line with the reactions on every menu, such as after the bot was offline.
+Reactors are paged through for each menu and compared against the role's members, then every member that needs
+changing is edited once by a small pool of workers."""
+    def __init__(self, bot: commands.Bot, menus: RoleMenuRegistry, workers: int = 4):
+        self.bot = bot
+        self.menus = menus
+        self.workers = workers
+        self.phase = "idle"
+        self.menus_total = self.menus_done = 0
+        self.members_total = self.members_done = 0
+        self.edits = self.failed = 0
+        self.started_at = self.applying_since = None
+
+    @property
+    def running(self) -> bool:
+        return self.phase not in ("idle", "finished")
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated number of seconds left while changes are being applied, or None if it isn't known yet"""
+        if self.phase != "applying" or not self.members_done:
+            return None
+        rate = self.members_done / (time.monotonic() - self.applying_since)
+        return (self.members_total - self.members_done) / rate
+
+    def progress_report(self) -> str:
+        if self.phase == "idle":
+            return "Reaction roles have not been reconciled yet."
+        report = (f"Phase: `{self.phase}`\n"
+                  f"Menus scanned: `{self.menus_done}/{self.menus_total}`\n"
+                  f"Members checked: `{self.members_done}/{self.members_total}`\n"
+                  f"Members edited: `{self.edits}` (`{self.failed}` failed)\n"
+                  f"Elapsed: `{round(time.monotonic() - self.started_at)}s`")
+        if self.eta is not None:
+            report += f"\nETA: `{round(self.eta)}s`"
+        return report
+
+    async def run(self, *, prune: bool = False, guild_id: int = None) -> None:
+        """Reconciles every registered menu, or only a guild's menus if `guild_id` is given. Roles are always given
+to reactors that are missing them, members that have the role without reacting only lose it if `prune` is True and
+no other menu gives the role"""
+        self.phase = "scanning"
+        self.started_at = time.monotonic()
+        menus = [menu for menu in self.menus if guild_id is None or menu.guild_id == guild_id]
+        self.menus_total, self.menus_done = len(menus), 0
+        self.members_total = self.members_done = self.edits = self.failed = 0
+
+        prunable = set()
+        if prune and self.bot.cache_policy.name == "minimal":
+            # role.members is empty without a member cache, so pruning would silently do nothing
+            self.bot.logger.write(status=StatusType.WARNING,
+                                  message="Not pruning reaction roles, role members aren't known under the minimal "
+                                          "cache policy")
+        elif prune:
+            uses = Counter(role_id for menu in self.menus for role_id in menu.roles.values())
+            prunable = {role_id for role_id, count in uses.items() if count == 1}
+
+        changes = {}  # (guild id, member id) -> [role ids to add, role ids to remove]
+        for menu in menus:
+            try:
+                await self._diff_menu(menu, changes, prunable)
+            except discord.NotFound:
+                # The message was deleted since the menus were verified
+                self.menus.remove(menu.message_id)
+                self.bot.snapshot.mark_dirty()
+                self.bot.logger.write(status=StatusType.WARNING,
+                                      message=f"Dropped reaction role menu with id: {menu.full_id!r}, its message "
+                                              f"no longer exists")
+            except discord.HTTPException:
+                self.bot.logger.write(status=StatusType.WARNING,
+                                      message=f"Failed to reconcile reaction role menu with id: {menu.full_id!r}")
+            self.menus_done += 1
+
+        self.phase = "applying"
+        self.applying_since = time.monotonic()
+        self.members_total = len(changes)
+        queue = asyncio.Queue()
+        for item in changes.items():
+            queue.put_nowait(item)
+        workers = [self.bot.loop.create_task(self._worker(queue)) for _ in range(self.workers)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.phase = "finished"
+
+        self.bot.logger.write(status=StatusType.OK,
+                              message=f"Reconciled reaction roles for {self.menus_total} menus\n{self.progress_report()}")
+
+    async def _diff_menu(self, menu: RoleMenu, changes: dict, prunable: set) -> None:
+        channel = self.bot.get_channel(menu.channel_id)
+        if channel is None:
+            return
+        message = await channel.fetch_message(menu.message_id)
+        reactions = {emoji_key(reaction.emoji): reaction for reaction in message.reactions}
+        await self.bot.cache_policy.ensure_chunked(channel.guild)  # role.members needs the whole guild cached
+
+        for emoji, role_id in menu.roles.items():
+            role = channel.guild.get_role(role_id)
+            if role is None:
+                continue
+
+            reactors = set()
+            if emoji in reactions:
+                async for user in reactions[emoji].users(limit=None):
+                    if not user.bot:
+                        reactors.add(user.id)
+            holders = {member.id for member in role.members}
+
+            for member_id in reactors - holders:
+                changes.setdefault((menu.guild_id, member_id), [set(), set()])[0].add(role_id)
+            if role_id in prunable:
+                for member_id in holders - reactors:
+                    changes.setdefault((menu.guild_id, member_id), [set(), set()])[1].add(role_id)
+            await asyncio.sleep(0)  # Let other events run between large roles
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            (guild_id, member_id), (to_add, to_remove) = await queue.get()
+            try:
+                guild = self.bot.get_guild(guild_id)
+                member = await self.bot.cache_policy.get_member(guild, member_id) if guild is not None else None
+                if member is not None and not member.bot:
+                    current_roles = {role.id for role in member.roles if not role.is_default()}
+                    new_roles = (current_roles | to_add) - to_remove
+                    if new_roles != current_roles:
+                        await member.edit(roles=[discord.Object(id=role_id) for role_id in new_roles])
+                        self.bot.cache_policy.forget(guild_id, member_id)
+                        self.edits += 1
+            except discord.HTTPException:
+                self.failed += 1
+            finally:
+                self.members_done += 1
+                queue.task_done()
+
+
 class ReactionRoles(commands.Cog, name="Reaction Roles"):
     """Reaction Role Menus"""
     def __init__(self, bot):
         self.bot = bot
-        self.role_menus = {}
+        self.menus = RoleMenuRegistry()
+        self.role_edits = RoleEditBuffer(bot)
+        self.reconciler = MenuReconciler(bot, self.menus)
+        self._startup_task = None
+        self._initialised = False
+        bot.snapshot.register("role_menus", self.dump_role_menus)
+
+    def dump_role_menus(self):
+        if not self._initialised:
+            return None
+        menus = [[menu.guild_id, menu.channel_id, menu.message_id, menu.roles] for menu in self.menus]
+        return {"menus": menus}
+
+    def load_snapshot(self, snapshot: dict) -> None:
+        """Builds the menu registry from a snapshot, only checking that each menu's channel can still be seen"""
+        self.menus.clear()
+        cluster = self.bot.cluster
+        for guild_id, channel_id, message_id, roles in snapshot["menus"]:
+            if cluster.worker_for(guild_id) != cluster.worker_id:
+                continue  # Loaded by the worker the guild's shard is on
+            if self.bot.get_channel(channel_id) is None:
+                self.bot.logger.write(status=StatusType.WARNING,
+                                      message=f"Failed to load reaction role menu with id: '{channel_id}-{message_id}'"
+                                      )
+                continue
+            self.menus.add(RoleMenu(guild_id, channel_id, message_id, roles))
 
     async def load_role_menus(self):
-        # Load all role menus from the role_menus.json file and save them as an attribute
-        chdir(f"{self.bot.BASE_DIR}/resources")
-        with open("role_menus.json", "r") as f:
-            menu_data = load(f)
-
-        num_failed_loads = 0
-        for full_id, data in menu_data.items():
-            # Save the key as a discord message object
-            channel_id, message_id = full_id.split("-")
-            try:
-                channel = self.bot.get_channel(int(channel_id))
-                if channel is None:
-                    raise ChannelNotFound
-                message = await channel.fetch_message(int(message_id))
-            except discord.errors.NotFound or ChannelNotFound:
-                # Message was deleted, bot can't view the channel, etc.
+        """Builds the menu registry from the ids saved in the store, without making any API calls"""
+        self.menus.clear()
+        num_failed_loads = num_elsewhere = 0
+        for channel_id, message_id, data in await self.bot.store.role_menus.all():
+            channel = self.bot.get_channel(channel_id)
+            if channel is None and not self.bot.cluster.runs_every_shard:
+                # The store doesn't keep guild ids, so a deleted channel can't be told apart from one on another
+                # worker's shards. The latter is far more likely, so it isn't reported as a failure.
+                num_elsewhere += 1
+                continue
+            if channel is None:
+                # Channel was deleted, bot can't view the channel, etc.
                 num_failed_loads += 1
-                chdir(self.bot.BASE_DIR)
                 self.bot.logger.write(status=StatusType.WARNING,
-                                      message=f"Failed to load reaction role menu with id: {full_id!r}"
+                                      message=f"Failed to load reaction role menu with id: '{channel_id}-{message_id}'"
                                       )
                 continue  # continue to next reaction role menu
 
-            role_emoji_dict = {}
-            # Convert role ids to discord role objects
-            for emoji, role_id in data.items():
-                role = channel.guild.get_role(int(role_id))
-                emoji = emojize(emoji)
-                role_emoji_dict[emoji] = role
+            roles = {emojize(emoji): int(role_id) for emoji, role_id in data.items()}
+            self.menus.add(RoleMenu(channel.guild.id, channel.id, message_id, roles))
+        print(f"\nLoading Reaction Roles\n{'=' * 22}\nLoaded: {len(self.menus)}\nFailed to load {num_failed_loads}"
+              f"\nOn other workers' shards: {num_elsewhere}")
+
+    async def verify_role_menus(self, concurrency: int = 5):
+        """Checks that the message of every loaded menu still exists, dropping any menus that can't be found.
+At most `concurrency` messages are fetched at once."""
+        semaphore = asyncio.Semaphore(concurrency)
 
-            self.role_menus[message] = role_emoji_dict
-        print(f"\nLoading Reaction Roles\n{'=' * 22}\nLoaded: {len(self.role_menus)}\nFailed to load {num_failed_loads}")
-        chdir(self.bot.BASE_DIR)
+        async def verify(menu: RoleMenu):
+            async with semaphore:
+                channel = self.bot.get_channel(menu.channel_id)
+                try:
+                    if channel is None:
+                        raise ChannelNotFound
+                    await channel.fetch_message(menu.message_id)
+                except (discord.NotFound, discord.Forbidden, ChannelNotFound):
+                    self.menus.remove(menu.message_id)
+                    self.bot.logger.write(status=StatusType.WARNING,
+                                          message=f"Failed to load reaction role menu with id: {menu.full_id!r}"
+                                          )
+                except discord.HTTPException:
+                    pass  # Keep the menu, it will be checked again on the next startup
+
+        await asyncio.gather(*[verify(menu) for menu in list(self.menus)])
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await self.load_role_menus()
+        # Menus are kept up to date by the commands, so reconnecting doesn't need them loaded again
+        if self._initialised:
+            return
+        self._initialised = True
+        snapshot = self.bot.snapshot.get("role_menus", store_backed=True)
+        if snapshot is not None:
+            self.load_snapshot(snapshot)
+        else:
+            await self.load_role_menus()
+        self._startup_task = self.bot.loop.create_task(self.startup_checks())
+
+    async def startup_checks(self):
+        """Drops menus that no longer exist, then catches up on any reactions missed while offline. Under the minimal cache policy catching up would fetch every reactor one request at
+a time on every start, so that's left to `rr reconcile`."""
+        # Messages can be deleted while the bot is offline, so this runs on every start, even from a snapshot
+        await self.verify_role_menus()
+        self.bot.snapshot.mark_dirty()
+        if self.bot.cache_policy.name == "minimal":
+            self.bot.logger.write(status=StatusType.OK,
+                                  message="Not reconciling reaction roles at startup under the minimal cache policy, "
+                                          "use `rr reconcile` to catch up on missed reactions")
+        elif not self.reconciler.running:
+            await self.reconciler.run()
+
+    def cog_unload(self):
+        if self._startup_task is not None:
+            self._startup_task.cancel()
+        self.role_edits.cancel()
 
     @commands.group(
         brief="Create or delete a role menu, do `help rr` for more info.",
@@ -101,16 +450,11 @@ class ReactionRoles(commands.Cog, name="Reaction Roles"):
         for emoji in emojis:
             await role_menu_message.add_reaction(emoji)
 
-        chdir(f"{self.bot.BASE_DIR}/resources")
-        with open("role_menus.json", "r") as f:
-            menus = load(f)
-        menus[f"{str(role_menu_message.channel.id)}-{str(role_menu_message.id)}"] = role_emoji_dict
-
-        with open("role_menus.json", "w") as f:
-            dump(menus, f, indent=2)
-        chdir(self.bot.BASE_DIR)
+        await self.bot.store.role_menus.upsert(role_menu_message.channel.id, role_menu_message.id, role_emoji_dict)
 
-        await self.load_role_menus()
+        roles = {emojize(emoji): role_id for emoji, role_id in role_emoji_dict.items()}
+        self.menus.add(RoleMenu(ctx.guild.id, ctx.channel.id, role_menu_message.id, roles))
+        self.bot.snapshot.mark_dirty()
     
     # Delete a role menu
     @reaction_role_menu.command(
@@ -119,73 +463,91 @@ class ReactionRoles(commands.Cog, name="Reaction Roles"):
         description="Deletes a role menu message and removes its data.",
         aliases=["rmv"]
     )
-    async def role_menu_remove(self, ctx, *, full_id):
-        if "-" in full_id:
-            channel_id, message_id = id.split("-")
-        else:
-            channel_id = full_id[0]
-            message_id = full_id[1]
+    async def role_menu_remove(self, ctx, *, full_id: menu_id):
+        channel_id, message_id = full_id
+        if channel_id is None:
+            # Only a message id was given, assume it's in the current channel
+            channel_id = ctx.channel.id
 
-        chdir(f"{self.bot.BASE_DIR}/resources")
-        with open("role_menus.json", "r") as f:
-            menus = load(f)
-        
-        try:
-            # Check if a role menu under channel_id-message_id exists
-            menus[f"{channel_id}-{message_id}"]
-
-        except KeyError:
+        if not await self.bot.store.role_menus.delete(message_id):
             # Wrong channel/message id(s)
-            saved_ids = "\n".join(list(menus.keys()))
+            saved_ids = "\n".join(f"{saved_channel}-{saved_message}"
+                                  for saved_channel, saved_message, _ in await self.bot.store.role_menus.all())
             await ctx.send(f"There is not a registered role menu under `{channel_id}-{message_id}`."
                            f"\nThe following is a list of all currently saved menus. \n```{saved_ids}\n```")
 
         else:
-            # Role menu with the id exists
-            del menus[f"{channel_id}-{message_id}"]
+            # Role menu with the id existed
+            self.menus.remove(message_id)
+            self.bot.snapshot.mark_dirty()
             await ctx.send(f"Role menu with the id of `{channel_id}-{message_id}` has been successfully deleted.")
-        
-            channel = self.bot.get_channel(int(channel_id))
-            message = await channel.fetch_message(int(message_id))
 
-            with open("role_menus.json", "w") as f:
-                dump(menus, f, indent=2)
-            chdir(f"{self.bot.BASE_DIR}/resources")
+            channel = self.bot.get_channel(channel_id)
+            try:
+                message = await channel.fetch_message(message_id)
+                await message.delete()
+            except (AttributeError, discord.NotFound):
+                pass  # Channel or message was already deleted
 
-            await message.delete()
-            await self.load_role_menus()
+    @reaction_role_menu.command(
+        name="stats",
+        brief="Shows how many role edits have been combined.",
+        description="Shows how many reaction role changes were made and how many role edits they were combined into."
+    )
+    async def role_menu_stats(self, ctx):
+        stats = self.role_edits.stats
+        await ctx.send(f"Role changes: `{stats['changes']}`\n"
+                       f"Role edits sent: `{stats['edits']}`\n"
+                       f"Edits saved by combining: `{stats['coalesced']}`\n"
+                       f"Skipped (no change): `{stats['skipped']}`\n"
+                       f"Failed edits: `{stats['failed']}`")
+
+    @reaction_role_menu.command(
+        name="reconcile",
+        brief="Syncs menu roles with their reactions.",
+        description="Gives this server's menu roles to everyone who reacted while the bot was offline. Passing "
+                    "`yes` for prune also removes roles from members that haven't reacted, even if they were given "
+                    "the role some other way, unless another menu gives the same role. Shows the progress if already "
+                    "running."
+    )
+    async def role_menu_reconcile(self, ctx, prune: bool = False):
+        if self.reconciler.running:
+            await ctx.send(self.reconciler.progress_report())
+            return
+        if prune and self.bot.cache_policy.name == "minimal":
+            await ctx.send("Roles can't be pruned while the bot isn't keeping member lists (the `minimal` cache "
+                           "policy), run the command without prune to only give missing roles.")
+            return
+
+        self.bot.loop.create_task(self.reconciler.run(prune=prune, guild_id=ctx.guild.id))
+        await ctx.send(f"Reconciling this server's role menus, "
+                       f"run `{ctx.prefix}rr reconcile` again to see the progress.")
 
     # Listeners to add/remove the roles
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        if payload.member.bot:
+        menu = self.menus.get(payload.message_id, payload.guild_id)
+        if menu is None or payload.member is None or payload.member.bot:
             return
 
-        for message in self.role_menus.keys():
-            if payload.message_id == message.id:
-                if payload.emoji.is_custom_emoji():
-                    emoji_name = f"<:{payload.emoji.name}:{payload.emoji.id}>"
-                else:
-                    emoji_name = payload.emoji.name
-                role = self.role_menus[message][emoji_name]
-                await payload.member.add_roles(role)
-    
+        role_id = menu.roles.get(emoji_key(payload.emoji))
+        if role_id is not None:
+            self.role_edits.add_role(payload.member, role_id)
+
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
-        guild = self.bot.get_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id)
+        menu = self.menus.get(payload.message_id, payload.guild_id)
+        if menu is None:
+            return
 
-        if member.bot:
+        guild = self.bot.get_guild(payload.guild_id)
+        member = await self.bot.cache_policy.get_member(guild, payload.user_id) if guild is not None else None
+        if member is None or member.bot:
             return
 
-        for message in self.role_menus.keys():
-            if payload.message_id == message.id:
-                if payload.emoji.is_custom_emoji():
-                    emoji_name = f"<:{payload.emoji.name}:{payload.emoji.id}>"
-                else:
-                    emoji_name = payload.emoji.name
-                role = self.role_menus[message][emoji_name]
-                await member.remove_roles(role)
+        role_id = menu.roles.get(emoji_key(payload.emoji))
+        if role_id is not None:
+            self.role_edits.remove_role(member, role_id)
 
 
 def setup(bot):
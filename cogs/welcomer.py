@@ -2,16 +2,50 @@
 import discord
 from discord.ext import commands
 from discord.utils import get
+from discord.ext.commands import Greedy
 
+# Other Imports
+from outbox import Priority
+from utils import StatusType
+from collections import OrderedDict
+import asyncio
+import time
 
-def create_embed(message, member, color) -> discord.Embed:
+DEFAULT_BURST_THRESHOLD = 10  # Members joining (or leaving) within BURST_WINDOW before they're welcomed together
+BURST_WINDOW = 60.0           # Seconds the join rate is counted over
+BURST_DELAY = 10.0            # Seconds members are held for before a summary of them is sent
+SUMMARY_LENGTH = 4000         # Most characters of mentions in a summary embed, which can hold 4096
+DEFAULT_MESSAGES = {
+    "join": "Everyone please welcome {member} to {server}!",
+    "leave": "Sorry to see you go {member}, hope to see you again!",
+}
+
+
+def create_embed(message, user, guild, color) -> discord.Embed:
     """Creates an embed with a given message, color, and thumbnail"""
     embed = discord.Embed(
         description=message,
         color=color
     )
-    embed.set_thumbnail(url=member.avatar_url)
-    embed.set_footer(text=f"Member Count: {member.guild.member_count}")
+    embed.set_thumbnail(url=user.avatar_url)
+    embed.set_footer(text=f"Member Count: {guild.member_count}")
+    return embed
+
+
+def create_summary_embed(message, users, guild, color) -> discord.Embed:
+    """Creates an embed with a given message, color, and a list of as many of the users as fit"""
+    mentions, length = [], len(message)
+    for user in users:
+        length += len(user.mention) + 1
+        if length > SUMMARY_LENGTH:
+            mentions.append(f"and {len(users) - len(mentions)} more")
+            break
+        mentions.append(user.mention)
+    embed = discord.Embed(
+        description=f"{message}\n" + " ".join(mentions),
+        color=color
+    )
+    embed.set_footer(text=f"Member Count: {guild.member_count}")
     return embed
 
 
@@ -21,49 +55,200 @@ def get_welcome_channel(guild: discord.Guild) -> discord.TextChannel:
             return channel
 
 
+def auto_role_problem(role: discord.Role, member: discord.Member):
+    """Returns why a member can't make a role an auto role, or None if they can. Members can only hand out roles
+below their own top role (unless they own the server), and the bot can only give roles below its own."""
+    if role.is_default() or role.managed:
+        return f"{role.mention} is managed by Discord or an integration, so it can't be given out"
+    if role >= member.guild.me.top_role:
+        return f"{role.mention} isn't below my highest role, so I can't give it out"
+    if member.id != member.guild.owner_id and role >= member.top_role:
+        return f"{role.mention} isn't below your highest role, so you can't give it out"
+    return None
+
+
+def format_message(message: str, user, guild) -> str:
+    """Fills in a welcomer message's {member} and {server}"""
+    return message.replace("{member}", user.mention).replace("{server}", guild.name)
+
+
+class RateCounter:
+    """Counts events per key over the last `window` seconds, in `slots` buckets that are reused as time moves on, so
+a key takes the same memory however many events it has. Only the `max_keys` most recently counted keys are kept."""
+    def __init__(self, window: float, *, slots: int = 6, max_keys: int = 1000):
+        self.slot_length = window / slots
+        self.slots = slots
+        self.max_keys = max_keys
+        self._counts = OrderedDict()  # key -> [number of the newest slot, count in each slot]
+
+    def add(self, key) -> int:
+        """Counts an event, returns how many events the key had within the window (including this one)"""
+        slot = int(time.monotonic() / self.slot_length)
+        entry = self._counts.pop(key, None)
+        if entry is None:
+            entry = [slot, [0] * self.slots]
+        newest, counts = entry
+        for passed in range(max(newest + 1, slot - self.slots + 1), slot + 1):
+            counts[passed % self.slots] = 0  # Clear the slots that were last used a window ago
+        entry[0] = max(newest, slot)
+        counts[slot % self.slots] += 1
+
+        self._counts[key] = entry
+        if len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+        return sum(counts)
+
+
 class AutoWelcomer(commands.Cog):
     """Auto Welcomer"""
     def __init__(self, bot):
         self.bot = bot
+        self.config = {}  # guild id -> welcomer settings
+        self._channels = {}  # guild id -> id of its welcome channel (None if it has none), until its channels change
+        self.rates = RateCounter(BURST_WINDOW)
+        self._bursts = {}  # (guild id, "join" or "leave") -> users waiting to be sent in a summary
+        self._burst_tasks = set()
+        self._load_task = bot.loop.create_task(self.load_config())
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member):
-        if member.guild.id == 973697002242199562:
-            welcome_channel = member.guild.get_channel(973699831556100146)
-            for role in [973833839719895040, 973995842035933284, 973834101943590932, 973831426862612490]:
-                member.add_role(guild.get_role(role))
+    async def load_config(self):
+        config = await self.bot.store.welcomer_config.all()
+        config.update(self.config)  # Keep anything changed while loading
+        self.config = config
+        self._channels.clear()
+
+    def cog_unload(self):
+        self._load_task.cancel()
+        for task in self._burst_tasks:
+            task.cancel()
+
+    def burst_threshold(self, guild_id: int) -> int:
+        return self.config.get(guild_id, {}).get("burst_threshold", DEFAULT_BURST_THRESHOLD)
+
+    def message(self, guild_id: int, kind: str) -> str:
+        return self.config.get(guild_id, {}).get(f"{kind}_message", DEFAULT_MESSAGES[kind])
+
+    def welcome_channel(self, guild: discord.Guild):
+        """Returns the guild's configured welcome channel, or the first channel with "welcome" in its name. Either is
+remembered until the guild's channels or settings change."""
+        if guild.id not in self._channels:
+            channel_id = self.config.get(guild.id, {}).get("channel_id")
+            channel = guild.get_channel(channel_id) if channel_id is not None else None
+            if channel is None:
+                channel = get_welcome_channel(guild)
+            self._channels[guild.id] = channel and channel.id
+        channel_id = self._channels[guild.id]
+        return guild.get_channel(channel_id) if channel_id is not None else None
 
+    async def save_setting(self, guild_id: int, name: str, value) -> None:
+        """Changes one of a guild's settings, removing it (going back to the default) if the value is None"""
+        settings = self.config.setdefault(guild_id, {})
+        if value is None:
+            settings.pop(name, None)
         else:
-            welcome_channel = get_welcome_channel(member.guild)
+            settings[name] = value
+        self._channels.pop(guild_id, None)
+        await self.bot.store.welcomer_config.upsert(guild_id, settings)
 
-        if welcome_channel is not None:
-            welcome_embed = create_embed(f"Everyone please welcome {member.mention} to {member.guild.name}!",
+    async def add_auto_roles(self, member):
+        role_ids = self.config.get(member.guild.id, {}).get("auto_roles")
+        if not role_ids:
+            return
+        roles = [role for role in map(member.guild.get_role, role_ids) if role is not None]
+        if not roles:
+            return
+        try:
+            await member.add_roles(*roles, reason="Welcomer auto roles")
+        except discord.HTTPException as e:
+            self.bot.logger.write(status=StatusType.WARNING,
+                                  message=f"Couldn't give {member} their auto roles in {member.guild.name}: {e}")
+
+    def add_to_burst(self, channel, guild, kind: str, user) -> bool:
+        """Counts a member joining or leaving, and holds them for a summary if too many are. Returns whether they
+were held, otherwise they should be sent on their own."""
+        key = (guild.id, kind)
+        count = self.rates.add(key)
+        users = self._bursts.get(key)
+        if users is None:
+            threshold = self.burst_threshold(guild.id)
+            if not threshold or count <= threshold:
+                return False
+            users = self._bursts[key] = []
+            task = self.bot.loop.create_task(self.send_burst(channel, guild, kind))
+            self._burst_tasks.add(task)
+            task.add_done_callback(self._burst_tasks.discard)
+        users.append(user)
+        return True
+
+    async def send_burst(self, channel, guild, kind):
+        await asyncio.sleep(BURST_DELAY)
+        users = self._bursts.pop((guild.id, kind))
+        if kind == "join":
+            embed = create_summary_embed(f"Everyone please welcome these {len(users)} members to {guild.name}!",
+                                         users,
+                                         guild,
+                                         0x1dfd00)
+        else:
+            embed = create_summary_embed(f"Sorry to see these {len(users)} members go, hope to see you again!",
+                                         users,
+                                         guild,
+                                         0xFF0000)
+        await self.bot.outbox.send(channel, embed=embed, priority=Priority.BULK)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        await self.add_auto_roles(member)
+        welcome_channel = self.welcome_channel(member.guild)
+        if welcome_channel is not None and not self.add_to_burst(welcome_channel, member.guild, "join", member):
+            welcome_embed = create_embed(format_message(self.message(member.guild.id, "join"), member, member.guild),
                                          member,
+                                         member.guild,
                                          0x1dfd00)
-            await welcome_channel.send(embed=welcome_embed)
-    
+            await self.bot.outbox.send(welcome_channel, embed=welcome_embed, priority=Priority.BULK)
+
     @commands.Cog.listener()
     async def on_member_remove(self, member):
-        if member.guild.id == 973697002242199562:
-            welcome_channel = member.guild.get_channel(973699831556100146)
-        else:
-            welcome_channel = get_welcome_channel(member.guild)
+        await self.send_goodbye(member.guild, member)
 
-        if welcome_channel is not None:
-            welcome_embed = create_embed(f"Sorry to see you go {member.mention}, hope to see you again!",
-                                         member,
+    @commands.Cog.listener()
+    async def on_uncached_member_remove(self, guild, user):
+        # Sent by the cache policy for members that weren't cached, `user` is a Member if they were fetched before
+        await self.send_goodbye(guild, user)
+
+    async def send_goodbye(self, guild, user):
+        welcome_channel = self.welcome_channel(guild)
+        if welcome_channel is not None and not self.add_to_burst(welcome_channel, guild, "leave", user):
+            welcome_embed = create_embed(format_message(self.message(guild.id, "leave"), user, guild),
+                                         user,
+                                         guild,
                                          0xFF0000)
-            roles = [role.mention for role in member.roles]
+            roles = [role.mention for role in getattr(user, "roles", [])]
             roles.reverse()
             welcome_embed.add_field(
                 name="Roles",
-                value=", ".join(roles)
+                value=", ".join(roles) or "Unknown"
             )
-            await welcome_channel.send(embed=welcome_embed)
+            await self.bot.outbox.send(welcome_channel, embed=welcome_embed, priority=Priority.BULK)
+
+    # Any channel change can change which channel is the welcome channel, so it's found again on the next join
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self._channels.pop(channel.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self._channels.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self._channels.pop(channel.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self._channels.pop(guild.id, None)
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        channel = get_welcome_channel(guild) or guild.text_channels[0]
+        channel = self.welcome_channel(guild) or guild.text_channels[0]
         await channel.send(f"""Thanks for inviting me to **{guild.name}**!
 {self.bot.user.mention} is a general purpose bot, that has tons of useful features!
 Some of these features include:
@@ -75,6 +260,89 @@ and many more!
 
 For a full list of all of the available commands, type `!help`""")
 
+    @commands.group(
+        brief="Change how members are welcomed, do `help welcomer` for more info.",
+        description="Features commands to change how the welcomer greets members of the server.",
+        invoke_without_command=True
+    )
+    @commands.has_permissions(manage_guild=True)
+    async def welcomer(self, ctx):
+        await ctx.send_help(self.welcomer)
+
+    @welcomer.command(
+        name="burst",
+        brief="Sets how many joins a minute start welcoming members together.",
+        description="Once more members than the threshold join (or leave) within a minute, they're welcomed in a "
+                    "single message every few seconds instead of one message each. A threshold of 0 always welcomes "
+                    "members one at a time. Running the command without a threshold shows the current one."
+    )
+    @commands.has_permissions(manage_guild=True)
+    async def welcomer_burst(self, ctx, threshold: int = None):
+        if threshold is None:
+            await ctx.send(f"Members are welcomed together once more than `{self.burst_threshold(ctx.guild.id)}` "
+                           f"join within a minute.")
+            return
+        if threshold < 0:
+            await ctx.send("The threshold can't be negative, use `0` to always welcome members one at a time.")
+            return
+
+        await self.save_setting(ctx.guild.id, "burst_threshold", threshold)
+        if threshold:
+            await ctx.send(f"Members will be welcomed together once more than `{threshold}` join within a minute.")
+        else:
+            await ctx.send("Members will always be welcomed one at a time.")
+
+    @welcomer.command(
+        name="channel",
+        brief="Sets the channel members are welcomed in.",
+        description="Sets the channel members are welcomed in. Running the command without a channel goes back to "
+                    "the first channel with \"welcome\" in its name."
+    )
+    @commands.has_permissions(manage_guild=True)
+    async def welcomer_channel(self, ctx, channel: discord.TextChannel = None):
+        await self.save_setting(ctx.guild.id, "channel_id", channel and channel.id)
+        channel = self.welcome_channel(ctx.guild)
+        if channel is None:
+            await ctx.send("There isn't a welcome channel, members won't be welcomed.")
+        else:
+            await ctx.send(f"Members will be welcomed in {channel.mention}.")
+
+    @welcomer.command(
+        name="roles",
+        brief="Sets the roles given to members when they join.",
+        description="Sets the roles given to every member when they join. Running the command without any roles "
+                    "stops giving members roles."
+    )
+    @commands.has_permissions(manage_guild=True, manage_roles=True)
+    async def welcomer_roles(self, ctx, roles: Greedy[discord.Role] = None):
+        problems = [problem for problem in (auto_role_problem(role, ctx.author) for role in roles or ()) if problem]
+        if problems:
+            await ctx.send("The auto roles weren't changed:\n" + "\n".join(problems))
+            return
+
+        await self.save_setting(ctx.guild.id, "auto_roles", [role.id for role in roles] if roles else None)
+        if roles:
+            await ctx.send("Members will be given " + ", ".join(role.mention for role in roles) + " when they join.")
+        else:
+            await ctx.send("Members won't be given any roles when they join.")
+
+    @welcomer.command(
+        name="message",
+        brief="Sets the message members are welcomed (join) or said goodbye to (leave) with.",
+        description="Sets the join or leave message, `{member}` is replaced with a mention of the member and "
+                    "`{server}` with the server's name. Running the command without a message goes back to the "
+                    "default one."
+    )
+    @commands.has_permissions(manage_guild=True)
+    async def welcomer_message(self, ctx, kind: str, *, message: str = None):
+        kind = kind.lower()
+        if kind not in DEFAULT_MESSAGES:
+            await ctx.send("Make sure to say which message to change, either `join` or `leave`.")
+            return
+        await self.save_setting(ctx.guild.id, f"{kind}_message", message)
+        example = format_message(self.message(ctx.guild.id, kind), ctx.author, ctx.guild)
+        await ctx.send(f"The {kind} message will look like:\n> {example}")
+
 
 def setup(bot):
     bot.add_cog(AutoWelcomer(bot))
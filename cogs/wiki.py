@@ -3,25 +3,65 @@ import discord
 from discord.ext import commands
 
 # Other Imports
-from bs4 import BeautifulSoup
-import requests
+from wiki_parse import extract_summary, export_article, get_pool, shutdown_pool
+from wiki_cache import WikiCache, cache_key
+from wiki_offline import OfflineIndex, RECORDS_FILE
+from wiki_suggest import TitleSuggester
+from functools import partial
 import os
+import io
+
+# Base url of every article, can be pointed at a local server for testing
+WIKI_URL = os.environ.get("WIKI_URL", "https://en.wikipedia.org/wiki")
+# Optional index built with `python wiki_offline.py build`, used before going to Wikipedia
+WIKI_OFFLINE_INDEX = os.environ.get("WIKI_OFFLINE_INDEX")
 
 
 def cleanup_url(url: str = None) -> str:
     if url is None:
-        return "https://en.wikipedia.org/wiki/Special:Random"
+        return f"{WIKI_URL}/Special:Random"
 
     url = url.lower()
     url = " ".join(elem.capitalize() for elem in url.split())
     url = url.replace(" ", "_")
-    return f"https://en.wikipedia.org/wiki/{url}"
+    return f"{WIKI_URL}/{url}"
+
+
+def page_title(heading: str, url: str) -> str:
+    """Returns a page's heading, or the title it was requested by for pages without one (such as special pages)"""
+    return heading or cache_key(url).replace("_", " ")
 
 
 class WikiTools(commands.Cog, name="Wikipedia Tools"):
     """A set of commands relating to Wikipedia"""
     def __init__(self, bot):
         self.bot = bot
+        self.cache = WikiCache(bot.http_client, f"{bot.BASE_DIR}/resources/wiki_cache",
+                               parse_executor=get_pool())
+
+        index_dir = WIKI_OFFLINE_INDEX or f"{bot.BASE_DIR}/resources/wiki_index"
+        self.offline = OfflineIndex(index_dir) if os.path.exists(os.path.join(index_dir, RECORDS_FILE)) else None
+        self.suggester = TitleSuggester()
+
+    def suggest(self, query: str, limit: int = 5) -> list:
+        """Returns titles the user might have meant, from previously found titles and the offline index"""
+        suggestions = self.suggester.suggest(query, limit)
+        if self.offline is not None:
+            suggestions += [title for title in self.offline.titles_with_prefix(query, limit) if title not in suggestions]
+        return suggestions[:limit]
+
+    async def send_missing_page(self, ctx, result) -> bool:
+        """Lets the user know if a lookup didn't find a page, returns whether it did"""
+        if result.status == 404:
+            suggestions = self.suggest(cache_key(result.url))
+            did_you_mean = "\nDid you mean: " + ", ".join(f"`{title}`" for title in suggestions) if suggestions else ""
+            await ctx.send(f"""Sorry, but it doesn't seem like {result.url} is a page that exists.
+Double check your spelling and try again, capitalization and spaces do not matter.{did_you_mean}""")
+            return True
+        if result.status != 200:
+            await ctx.send(f"Wikipedia couldn't be reached right now (status `{result.status}`), please try again later.")
+            return True
+        return False
 
     @commands.group(
         brief="Group of commands relating to Wikipedia articles.",
@@ -38,53 +78,93 @@ class WikiTools(commands.Cog, name="Wikipedia Tools"):
         aliases=["s"]
     )
     async def search(self, ctx, *, url: str = None):
+        if url is not None and self.offline is not None:
+            # Answer from the offline index if the article is in it, this also works while Wikipedia is down
+            article = self.offline.lookup(url)
+            if article is not None:
+                title, abstract = article
+                self.suggester.add(title)
+                embed = discord.Embed(
+                    description=abstract,
+                    color=self.bot.EMBED_COLOR
+                )
+                embed.set_author(name=f"{title} (Click for Full Page)", url=f"{WIKI_URL}/{title.replace(' ', '_')}")
+                await ctx.send(embed=embed)
+                return
+
         url = cleanup_url(url)
 
-        response = requests.get(url=url)
-        if response.status_code == 404:
-            await ctx.send(f"""Sorry, but it doesn't seem like {url} is a page that exists.
-Double check your spelling and try again, capitalization and spaces do not matter.""")
+        result = await self.cache.get(url, extract_summary)
+        if await self.send_missing_page(ctx, result):
             return
-
-        soup = BeautifulSoup(response.content, "html.parser")
-        all_paragraphs = soup.find_all("p")
-        summary = [p.get_text() for p in all_paragraphs if p.get_text() != "\n"][0]
+        heading, summary = result.page
+        heading = page_title(heading, url)
+        self.suggester.add(heading)
 
         embed = discord.Embed(
             description=summary,
             color=self.bot.EMBED_COLOR
         )
-        embed.set_author(name=f"{soup.find(id='firstHeading').string} (Click for Full Page)", url=url)
+        embed.set_author(name=f"{heading} (Click for Full Page)", url=result.url)
         await ctx.send(embed=embed)
 
     @wiki.command(
         brief="Saves an entire Wikipedia article as a `.txt` file.",
-        description="Takes a link to a Wikipedia page and saves it to a `.txt` file."
+        description="Takes a link to a Wikipedia page and saves it to a `.txt` file. Add `sections` to include the "
+                    "section headings, or `gzip` to compress the file. Articles too big to upload are split into "
+                    "several files."
     )
-    async def save(self, ctx, url: str):
-        url = url.replace("https://en.wikipedia.org/wiki/", "")
+    async def save(self, ctx, url: str, *options: str):
+        url = url.replace(f"{WIKI_URL}/", "")
         url = cleanup_url(url)
-
-        response = requests.get(url=url)
-        if response.status_code == 404:
-            await ctx.send(f"""Sorry, but it doesn't seem like {url} is a page that exists.
-Double check your spelling and try again, capitalization and spaces do not matter.""")
-            return
-
-        soup = BeautifulSoup(response.content, "html.parser")
-        all_paragraphs = [text.get_text() for text in soup.find_all("p") if text.get_text() != "\n"]
-        title = soup.find(id='firstHeading').string.lower().replace(" ", "_")
+        options = {option.lower() for option in options}
+        compress = bool(options & {"gzip", "gz"})
+        exporter = partial(
+            export_article,
+            sections=bool(options & {"sections", "headings"}),
+            compress=compress,
+            max_size=ctx.guild.filesize_limit if ctx.guild is not None else 8 * 1024 * 1024
+        )
 
         async with ctx.channel.typing():
-            os.chdir(f"{self.bot.BASE_DIR}/resources")
-            with open("latest_article.txt", "w", encoding="utf-8") as f:
-                f.write("".join(all_paragraphs))
-            with open("latest_article.txt", "rb") as f:
+            # The export is only needed once, so it isn't kept in the memory cache
+            result = await self.cache.get(url, exporter, remember=False)
+            if await self.send_missing_page(ctx, result):
+                return
+            heading, parts = result.page
+            heading = page_title(heading, url)
+            self.suggester.add(heading)
+            title = heading.lower().replace(" ", "_")
+            extension = "txt.gz" if compress else "txt"
+
+            if len(parts) == 1:
                 await ctx.send(
-                    f"Saved all available text for the article at: <{url}>.",
-                    file=discord.File(f, f"{title}.txt")
+                    f"Saved all available text for the article at: <{result.url}>.",
+                    file=discord.File(io.BytesIO(parts[0]), f"{title}.{extension}")
                 )
-            os.chdir(self.bot.BASE_DIR)
+                return
+
+            await ctx.send(f"Saved all available text for the article at: <{result.url}>. "
+                           f"It was too big for one file, so it has been split into {len(parts)} parts.")
+            for number, part in enumerate(parts, start=1):
+                await ctx.send(file=discord.File(io.BytesIO(part), f"{title}.part{number}.{extension}"))
+
+    @wiki.command(
+        name="cache",
+        hidden=True,
+        brief="Shows how well the Wikipedia cache is doing.",
+        description="Shows the hit and miss counters of the Wikipedia cache."
+    )
+    @commands.is_owner()
+    async def cache_stats(self, ctx):
+        await ctx.send("\n".join(f"{name.replace('_', ' ').capitalize()}: `{count}`"
+                                 for name, count in self.cache.stats.items()))
+
+    def cog_unload(self):
+        self.cache.close()
+        shutdown_pool()
+        if self.offline is not None:
+            self.offline.close()
 
 
 def setup(bot):
@@ -0,0 +1,180 @@
+"""Multi-step conversations with users, routed by (user id, channel id) instead of `bot.wait_for`"""
+# Discord Imports
+import discord
+from discord.ext import commands
+
+# Other Imports
+from collections import deque
+from bisect import bisect_left
+import asyncio
+import math
+
+
+class ConversationError(Exception):
+    ...
+
+
+class SessionLimitReached(ConversationError):
+    ...
+
+
+class SessionAlreadyOpen(ConversationError):
+    ...
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: int, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Runs callbacks after a delay from a single background task, accurate to within `tick` seconds.
+Timers are kept in `slots` buckets by the tick they're due on, so scheduling and cancelling are O(1)."""
+    def __init__(self, tick: float = 0.5, slots: int = 128):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._ticks = 0
+        self._size = 0
+        self._started_at = 0.0
+        self._task = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def schedule(self, delay: float, callback) -> Timer:
+        """Calls `callback` after `delay` seconds, returns a Timer that can be cancelled"""
+        if self._task is None or self._task.done():
+            loop = asyncio.get_event_loop()
+            self._ticks = 0
+            self._started_at = loop.time()
+            self._task = loop.create_task(self._run())
+
+        timer = Timer(self._ticks + max(1, math.ceil(delay / self.tick)), callback)
+        self._slots[timer.deadline % len(self._slots)].append(timer)
+        self._size += 1
+        return timer
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while self._size:
+            # Sleep until the next tick is due, so time spent running callbacks doesn't add up
+            await asyncio.sleep(max(0.0, self._started_at + (self._ticks + 1) * self.tick - loop.time()))
+            self._ticks += 1
+            slot = self._slots[self._ticks % len(self._slots)]
+            due = [timer for timer in slot if timer.deadline <= self._ticks]
+            if not due:
+                continue
+            slot[:] = [timer for timer in slot if timer.deadline > self._ticks]
+            self._size -= len(due)
+            for timer in due:
+                if not timer.cancelled:
+                    timer.callback()
+
+
+class NameIndex:
+    """Case-insensitive lookup of objects by their `name`, by exact name or by a unique prefix"""
+    def __init__(self, objects):
+        self._exact = {}
+        for obj in objects:
+            self._exact.setdefault(obj.name.lower(), []).append(obj)
+        self._names = sorted(self._exact)
+
+    def find(self, query: str) -> list:
+        """Returns every object named `query`, or if there are none, every object whose name starts with it"""
+        query = query.strip().lower()
+        matches = list(self._exact.get(query, []))
+        if matches or not query:
+            return matches
+
+        index = bisect_left(self._names, query)
+        while index < len(self._names) and self._names[index].startswith(query):
+            matches.extend(self._exact[self._names[index]])
+            index += 1
+        return matches
+
+
+class Session:
+    """An open conversation with a user in a channel, close it (or use it as a context manager) when finished"""
+    def __init__(self, manager: "ConversationManager", key: tuple, after: int = 0):
+        self._manager = manager
+        self.key = key
+        self.after = after
+        self._waiter = None
+        self._inbox = deque(maxlen=5)  # Messages sent while nothing was waiting for one
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.cancel()
+        self._manager._close(self)
+
+    def _deliver(self, message: discord.Message) -> None:
+        if message.id <= self.after:
+            return  # Sent before the session was opened, such as the command that opened it
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(message)
+        else:
+            self._inbox.append(message)
+
+    def _time_out(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(asyncio.TimeoutError())
+
+    async def next_message(self, timeout: float = 30.0) -> discord.Message:
+        """Waits for the user's next message in the channel, raises asyncio.TimeoutError after `timeout` seconds"""
+        if self._inbox:
+            return self._inbox.popleft()
+        self._waiter = asyncio.get_event_loop().create_future()
+        timer = self._manager.timers.schedule(timeout, self._time_out)
+        try:
+            return await self._waiter
+        finally:
+            timer.cancel()
+            self._waiter = None
+
+
+class ConversationManager:
+    """Routes each incoming message to the open session for its (author id, channel id) with one dict lookup"""
+    def __init__(self, bot: commands.Bot, max_sessions: int = 1000):
+        self.bot = bot
+        self.max_sessions = max_sessions
+        self.timers = TimerWheel()
+        self._sessions = {}
+        bot.add_listener(self.on_message, "on_message")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def start(self, user_id: int, channel_id: int, *, after: int = 0) -> Session:
+        """Opens a session, only messages with an id greater than `after` are passed to it.
+Raises SessionAlreadyOpen if the user already has one in the channel or SessionLimitReached if too many are open"""
+        key = (user_id, channel_id)
+        if key in self._sessions:
+            raise SessionAlreadyOpen
+        if len(self._sessions) >= self.max_sessions:
+            raise SessionLimitReached
+        session = self._sessions[key] = Session(self, key, after)
+        return session
+
+    def _close(self, session: Session) -> None:
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+
+    async def on_message(self, message):
+        if not self._sessions:
+            return
+        session = self._sessions.get((message.author.id, message.channel.id))
+        if session is not None:
+            session._deliver(message)
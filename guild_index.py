@@ -0,0 +1,74 @@
+"""Reverse index of users to the guilds they share with the bot"""
+# Discord Imports
+import discord
+from discord.ext import commands
+
+
+class MutualGuildIndex:
+    """Maps each user id to the ids of the guilds they share with the bot.
+Built from the member cache when the bot is ready and kept up to date by member and guild events, including the
+`on_uncached_member_remove` the cache policy dispatches for members discord.py didn't cache."""
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._guild_ids = {}  # user id -> set of guild ids
+
+        for event in ("on_ready", "on_member_join", "on_member_remove", "on_uncached_member_remove", "on_guild_join",
+                      "on_guild_remove"):
+            bot.add_listener(getattr(self, event), event)
+
+    def __len__(self) -> int:
+        return len(self._guild_ids)
+
+    def guild_ids(self, user_id: int) -> frozenset:
+        """Returns the ids of every guild shared with the given user"""
+        return frozenset(self._guild_ids.get(user_id, ()))
+
+    def guilds(self, user_id: int) -> list:
+        """Returns every guild shared with the given user"""
+        guilds = [self.bot.get_guild(guild_id) for guild_id in self._guild_ids.get(user_id, ())]
+        return [guild for guild in guilds if guild is not None]
+
+    def rebuild(self) -> None:
+        self._guild_ids = {}
+        for guild in self.bot.guilds:
+            self.add_guild(guild)
+
+    def add_guild(self, guild: discord.Guild) -> None:
+        for member in guild.members:
+            self.add_member(member)
+
+    def remove_guild(self, guild: discord.Guild) -> None:
+        for member in guild.members:
+            self.remove_member(member)
+
+    def add_member(self, member: discord.Member) -> None:
+        self._guild_ids.setdefault(member.id, set()).add(member.guild.id)
+
+    def remove_member(self, member: discord.Member) -> None:
+        self._discard(member.id, member.guild.id)
+
+    def _discard(self, user_id: int, guild_id: int) -> None:
+        guild_ids = self._guild_ids.get(user_id)
+        if guild_ids is None:
+            return
+        guild_ids.discard(guild_id)
+        if not guild_ids:
+            del self._guild_ids[user_id]
+
+    async def on_ready(self):
+        self.rebuild()
+
+    async def on_member_join(self, member):
+        self.add_member(member)
+
+    async def on_member_remove(self, member):
+        self.remove_member(member)
+
+    async def on_uncached_member_remove(self, guild, user):
+        self._discard(user.id, guild.id)
+
+    async def on_guild_join(self, guild):
+        self.add_guild(guild)
+
+    async def on_guild_remove(self, guild):
+        self.remove_guild(guild)
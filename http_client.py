@@ -0,0 +1,88 @@
+"""Shared async HTTP client"""
+# Other Imports
+from urllib.parse import urlsplit
+import asyncio
+import random
+
+import aiohttp
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPResponse:
+    """A fully read response, safe to use after the connection has been released"""
+    __slots__ = ("url", "status", "headers", "body")
+
+    def __init__(self, url: str, status: int, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+class HTTPClient:
+    """A pooled aiohttp session shared by every cog, with keep-alive connections, a concurrency limit per host,
+timeouts, and retries with exponential backoff for connection errors and 429/5xx responses"""
+    def __init__(self, *, limit: int = 100, limit_per_host: int = 8, timeout: float = 10.0, retries: int = 3,
+                 backoff: float = 0.5, keepalive_timeout: float = 30.0, user_agent: str = "Robo-Dart (Discord Bot)"):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.keepalive_timeout = keepalive_timeout
+        self.user_agent = user_agent
+        self._session = None
+        self._host_limits = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so that it's bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                                  headers={"User-Agent": self.user_agent})
+        return self._session
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.limit_per_host)
+        return self._host_limits[host]
+
+    def _retry_delay(self, attempt: int, response_headers=None) -> float:
+        retry_after = (response_headers or {}).get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+
+    async def request(self, method: str, url: str, **kwargs) -> HTTPResponse:
+        """Sends a request and reads the whole body, retrying failed attempts.
+Raises aiohttp.ClientError or asyncio.TimeoutError if every attempt fails to connect."""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._host_limit(url):
+                    async with self.session.request(method, url, **kwargs) as response:
+                        result = HTTPResponse(str(response.url), response.status, response.headers,
+                                              await response.read())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+
+            if result.status in RETRY_STATUSES and attempt < self.retries:
+                await asyncio.sleep(self._retry_delay(attempt, result.headers))
+                continue
+            return result
+
+    async def get(self, url: str, **kwargs) -> HTTPResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -4,13 +4,25 @@ import discord
 from discord.ext import commands
 
 # Keep Bot Online
-from webserver import keep_alive
+from webserver import WebServer
 
 # Other Imports
 from datetime import datetime            # Get bot launch time
 from os import listdir, getcwd, environ  # Load cogs/environment vars (token)
 from utils import Logger                 # Utility functions
 
+# Bot Services
+from store import Store
+from guild_index import MutualGuildIndex
+from conversations import ConversationManager
+from http_client import HTTPClient
+from metrics import Metrics
+from cluster import Cluster
+from cache_policy import CachePolicy
+from startup import StartupTimer, LazyCogs
+from snapshot import Snapshot
+from outbox import Outbox, Priority
+
 
 def get_token() -> str:
     # Load token
@@ -25,7 +37,40 @@ def get_token() -> str:
     return token
 
 
+class ReplyContext(commands.Context):
+    """Sends command replies through the outbox, so they go out after moderation results and before bulk output"""
+    async def send(self, content=None, **kwargs):
+        return await self.bot.outbox.send(self.channel, content, priority=Priority.REPLY, **kwargs)
+
+
+class RoboDart(commands.Bot):
+    async def get_context(self, message, *, cls=ReplyContext):
+        return await super().get_context(message, cls=cls)
+
+    _closing = False
+
+    async def close(self):
+        # The services can only be closed once, their executors are shut down by then
+        if self._closing:
+            return
+        self._closing = True
+        await super().close()  # Unloads every cog first, so their changes are saved before the snapshot
+        self.snapshot.close()
+        self.outbox.close()
+        await self.cluster.close()
+        await self.web_server.close()
+        await self.http_client.close()
+        self.store.close()
+        self.logger.close()
+
+
+class ShardedRoboDart(RoboDart, commands.AutoShardedBot):
+    """Runs a range of shards, used by cluster workers"""
+
+
 def main() -> None:
+    startup = StartupTimer()
+    startup.mark("Starting Python and importing")
     TOKEN = get_token()
 
     # Define the bot
@@ -33,23 +78,55 @@ def main() -> None:
     intents.members = True
     intents.presences = True
     intents.emojis = True
-    bot = commands.Bot(
+    options = dict(
         command_prefix=commands.when_mentioned_or("!"),
         owner_id=400337254989430784,
         case_insensitive=True,
         intents=intents,
     )
+    cache_policy = CachePolicy(environ.get("CACHE_POLICY", "full"))
+    options.update(cache_policy.client_options(intents))
+    cluster = Cluster.from_environment(environ)
+    if cluster.address is None:
+        bot = RoboDart(**options)
+        log_name, snapshot_name = "bot.log", "snapshot.json"
+    else:
+        # Started by cluster.py, only connect to this worker's shards
+        bot = ShardedRoboDart(shard_ids=cluster.shard_ids, shard_count=cluster.shard_count, **options)
+        log_name, snapshot_name = f"bot.{cluster.worker_id}.log", f"snapshot.{cluster.worker_id}.json"
+    bot.cluster = cluster
+    bot.cache_policy = cache_policy
+    cache_policy.attach(bot)
 
     # Custom Attributes
     bot.BASE_DIR = getcwd()
     bot.EMBED_COLOR = 0x0E151D
     bot.LAUNCH_TIME = datetime.utcnow()
-    bot.logger = Logger(bot, f"{bot.BASE_DIR}/resources/bot.log")
+    bot.logger = Logger(bot, f"{bot.BASE_DIR}/resources/{log_name}", log_format=environ.get("LOG_FORMAT", "text"))
+    bot.store = Store(f"{bot.BASE_DIR}/resources/bot.db")
+    bot.store.migrate_json(f"{bot.BASE_DIR}/resources")
+    bot.snapshot = Snapshot(bot.store, f"{bot.BASE_DIR}/resources/{snapshot_name}")
+    bot.mutual_guilds = MutualGuildIndex(bot)
+    bot.conversations = ConversationManager(bot)
+    bot.http_client = HTTPClient()
+    bot.outbox = Outbox()
+    bot.metrics = None
+    if environ.get("METRICS", "off") == "on":
+        # Off by default, every command and event is timed once installed
+        bot.metrics = Metrics(bot)
+        bot.metrics.install()
+    bot.web_server = WebServer(bot, port=int(environ.get("PORT", 8080)))
+    startup.mark("Creating the bot and its services")
 
-    # Load all cogs
+    # Load all cogs, cogs that only have commands are imported when one of them is first used
+    bot.lazy_cogs = LazyCogs(bot)
+    lazy_loading = environ.get("LAZY_COGS", "on") == "on"
     for filename in listdir("./cogs"):
         if filename.endswith(".py"):
-            bot.load_extension(f"cogs.{filename[:-3]}")
+            extension = f"cogs.{filename[:-3]}"
+            if not (lazy_loading and bot.lazy_cogs.register(extension, f"./cogs/{filename}")):
+                bot.load_extension(extension)
+    startup.mark("Loading cogs")
 
     @bot.event
     async def on_ready():
@@ -58,7 +135,12 @@ def main() -> None:
         print(f"Username: {bot.user.name}")
         print(f"User Id : {bot.user.id}")
 
-    keep_alive()
+    # Health checks are served from the bot's own loop, before logging in so probes can see it starting
+    bot.loop.run_until_complete(bot.web_server.start())
+    bot.loop.run_until_complete(bot.cluster.start())
+    bot.snapshot.start(bot.loop)
+    startup.mark("Starting the web server and cluster connection")
+    startup.attach(bot)
     bot.run(TOKEN)
 
 
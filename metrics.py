@@ -0,0 +1,212 @@
+"""Prometheus metrics for commands, event listeners and the Discord connection.
+
+Nothing is instrumented until `Metrics.install` is called, so a bot that doesn't serve metrics pays nothing per event.
+"""
+# Discord Imports
+from discord.ext import commands
+
+# Other Imports
+from bisect import bisect_left
+from time import perf_counter
+import logging
+import math
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name: str, label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    labels = [f'{label}="{_escape(value)}"' for label, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return f"{name}{{{','.join(labels)}}}" if labels else name
+
+
+def _value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A count per set of label values that only goes up"""
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}  # label values -> count
+
+    def inc(self, labels: tuple = (), amount: int = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{_series(self.name, self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Counts observations into fixed buckets per set of label values, observing is a bisect and two additions"""
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                total += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                bucket = _series(f"{self.name}_bucket", self.label_names, labels, f'le="{le}"')
+                lines.append(f"{bucket} {total}")
+            lines.append(f"{_series(self.name + '_sum', self.label_names, labels)} {series[-1]!r}")
+            lines.append(f"{_series(self.name + '_count', self.label_names, labels)} {total}")
+        return lines
+
+
+class _RateLimitHandler(logging.Handler):
+    """Counts the rate limit warnings discord.py logs when a REST request has to wait"""
+    def __init__(self, counter: Counter):
+        super().__init__(logging.WARNING)
+        self.counter = counter
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not isinstance(record.msg, str):
+            return
+        if record.msg.startswith("We are being rate limited"):
+            self.counter.inc(("route",))
+        elif record.msg.startswith("Global rate limit"):
+            self.counter.inc(("global",))
+
+
+class Metrics:
+    """Times every command and event listener of a bot and renders them, along with gauges of the connection and
+caches, in the Prometheus text format"""
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.installed = False
+        self.command_duration = Histogram("robodart_command_duration_seconds",
+                                          "Time taken to run a command, including its checks", ("command",))
+        self.command_errors = Counter("robodart_command_errors_total",
+                                      "Commands that failed, by error type", ("command", "error"))
+        self.listener_duration = Histogram("robodart_listener_duration_seconds",
+                                           "Time taken to run an event listener", ("event", "listener"))
+        self.listener_errors = Counter("robodart_listener_errors_total",
+                                       "Event listeners that raised an exception", ("event", "listener"))
+        self.rate_limits = Counter("robodart_rate_limits_total",
+                                   "Discord REST requests that hit a rate limit", ("scope",))
+        self._rate_limit_handler = _RateLimitHandler(self.rate_limits)
+
+    def install(self) -> None:
+        """Wraps command invocation and event dispatch with timers. Only the bot's own methods are replaced, so
+listeners added or removed later (cogs being reloaded) are timed too."""
+        if self.installed:
+            return
+        self.installed = True
+        bot = self.bot
+        invoke, run_event, on_command_error = bot.invoke, bot._run_event, bot.on_command_error
+
+        async def timed_invoke(ctx):
+            start = perf_counter()
+            try:
+                await invoke(ctx)
+            finally:
+                if ctx.command is not None:
+                    self.command_duration.observe((ctx.command.qualified_name,), perf_counter() - start)
+
+        async def timed_run_event(coro, event_name, *args, **kwargs):
+            labels = (event_name, getattr(coro, "__qualname__", event_name))
+
+            async def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    await coro(*args, **kwargs)
+                except Exception:
+                    self.listener_errors.inc(labels)
+                    raise
+                finally:
+                    self.listener_duration.observe(labels, perf_counter() - start)
+
+            await run_event(timed, event_name, *args, **kwargs)
+
+        # Replacing the handler rather than adding a listener keeps the default traceback printing
+        async def counted_on_command_error(ctx, error):
+            if ctx.command is not None:
+                error_type = type(getattr(error, "original", error)).__name__
+                self.command_errors.inc((ctx.command.qualified_name, error_type))
+            await on_command_error(ctx, error)
+
+        bot.invoke = timed_invoke
+        bot._run_event = timed_run_event
+        bot.on_command_error = counted_on_command_error
+        logging.getLogger("discord.http").addHandler(self._rate_limit_handler)
+
+    def _gauges(self) -> list:
+        bot = self.bot
+        guilds = bot.guilds
+        gauges = [
+            ("robodart_gateway_latency_seconds", "Time between the last heartbeat and its acknowledgement",
+             bot.latency),
+            ("robodart_guilds", "Guilds the bot is in", len(guilds)),
+            ("robodart_guild_members", "Members of every guild the bot is in, as reported by Discord",
+             sum(guild.member_count or 0 for guild in guilds)),
+            ("robodart_cached_members", "Members held in the member cache",
+             sum(len(guild.members) for guild in guilds)),
+            ("robodart_cached_users", "Users held in the user cache", len(bot.users)),
+        ]
+        if hasattr(bot, "web_server"):
+            gauges.append(("robodart_event_loop_lag_seconds", "How late the event loop last ran a scheduled callback",
+                           bot.web_server.loop_lag))
+        if hasattr(bot, "mutual_guilds"):
+            gauges.append(("robodart_mutual_guild_index_users", "Users in the mutual guild index",
+                           len(bot.mutual_guilds)))
+
+        if hasattr(bot, "outbox"):
+            gauges.append(("robodart_outbox_channels", "Channels with outgoing messages queued or being sent",
+                           len(bot.outbox)))
+
+        lines = []
+        for name, documentation, value in gauges:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_value(value)}"]
+        return lines
+
+    def _outbox(self) -> list:
+        """Returns the outgoing message queue depth at each priority and counts of what was sent"""
+        outbox = self.bot.outbox
+        name = "robodart_outbox_queued_messages"
+        lines = [f"# HELP {name} Outgoing messages waiting to be sent", f"# TYPE {name} gauge"]
+        for priority, depth in outbox.depth().items():
+            lines.append(f"{_series(name, ('priority',), (priority.name.lower(),))} {depth}")
+
+        name = "robodart_outbox_messages_total"
+        lines += [f"# HELP {name} Outgoing messages by what happened to them, batched ones were joined onto another",
+                  f"# TYPE {name} counter"]
+        for result, count in outbox.stats.items():
+            lines.append(f"{_series(name, ('result',), (result,))} {count}")
+        return lines
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text format, reads the bot's caches so must run on its loop"""
+        lines = self._gauges()
+        if hasattr(self.bot, "outbox"):
+            lines += self._outbox()
+        for metric in (self.command_duration, self.command_errors, self.listener_duration, self.listener_errors,
+                       self.rate_limits):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,153 @@
+"""Outgoing messages, queued per channel and sent in order of priority"""
+# Other Imports
+from enum import IntEnum
+import itertools
+import asyncio
+import heapq
+
+MAX_LENGTH = 2000
+
+
+class Priority(IntEnum):
+    """Lower values are sent first"""
+    MODERATION = 0  # Results of moderation commands
+    REPLY = 1       # Replies to commands
+    BULK = 2        # Welcome messages and other output nobody is waiting on
+
+
+class _Message:
+    __slots__ = ("priority", "order", "content", "kwargs", "batch", "future")
+
+    def __init__(self, priority: Priority, order: int, content, kwargs: dict, batch: bool, future: asyncio.Future):
+        self.priority = priority
+        self.order = order
+        self.content = content
+        self.kwargs = kwargs
+        self.batch = batch
+        self.future = future
+
+    def __lt__(self, other) -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class _PriorityGate:
+    """Limits how many sends run at once across every channel, letting the highest priority waiter in first"""
+    def __init__(self, limit: int):
+        self._available = limit
+        self._waiters = []  # heap of (priority, order, future)
+        self._order = itertools.count()
+
+    async def acquire(self, priority: Priority) -> None:
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Was let in just as it was cancelled, so pass the place on
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._available += 1
+
+
+class Outbox:
+    """Sends messages for every cog through one queue per channel, so a channel only ever has one send waiting on
+its rate limit and whatever is queued behind it goes out in order of priority. At most `concurrency` sends run at
+once across all channels (keeping clear of the global rate limit), again highest priority first. A send still
+running after `gate_hold` seconds is most likely waiting out its channel's own rate limit inside discord.py, which
+doesn't use up the global one, so it gives its place up to sends in other channels.
+
+Small text messages queued with `batch=True` are joined with the batchable messages of the same priority queued
+after them in the same channel, as long as they fit in one message."""
+    def __init__(self, *, concurrency: int = 10, gate_hold: float = 1.0):
+        self.gate_hold = gate_hold
+        self._queues = {}   # channel id -> heap of queued messages
+        self._workers = {}  # channel id -> task sending its queued messages
+        self._gate = _PriorityGate(concurrency)
+        self._order = itertools.count()
+        self.stats = {"sent": 0, "batched": 0, "failed": 0}
+
+    def send(self, channel, content=None, *, priority: Priority = Priority.REPLY, batch: bool = False,
+             **kwargs) -> asyncio.Future:
+        """Queues a message, takes the same arguments as `channel.send`. Returns a future of the sent message
+(shared by messages that were batched together), which should be awaited so errors aren't lost."""
+        loop = asyncio.get_event_loop()
+        batch = batch and not kwargs and isinstance(content, str)
+        message = _Message(priority, next(self._order), content, kwargs, batch, loop.create_future())
+        heapq.heappush(self._queues.setdefault(channel.id, []), message)
+        if channel.id not in self._workers:
+            self._workers[channel.id] = loop.create_task(self._send_queued(channel))
+        return message.future
+
+    def depth(self) -> dict:
+        """Returns how many messages are waiting at each priority"""
+        depth = dict.fromkeys(Priority, 0)
+        for queue in self._queues.values():
+            for message in queue:
+                depth[message.priority] += 1
+        return depth
+
+    def __len__(self) -> int:
+        """Number of channels with messages waiting or being sent"""
+        return len(self._workers)
+
+    def _next_group(self, queue: list) -> list:
+        group = [heapq.heappop(queue)]
+        if group[0].batch:
+            length = len(group[0].content)
+            while (queue and queue[0].batch and queue[0].priority == group[0].priority
+                   and length + 1 + len(queue[0].content) <= MAX_LENGTH):
+                length += 1 + len(queue[0].content)
+                group.append(heapq.heappop(queue))
+        return group
+
+    async def _send_queued(self, channel) -> None:
+        queue, group = self._queues[channel.id], []
+        try:
+            while queue:
+                group = self._next_group(queue)
+                first = group[0]
+                content = "\n".join(message.content for message in group) if first.batch else first.content
+                await self._gate.acquire(first.priority)
+                send = asyncio.ensure_future(channel.send(content, **first.kwargs))
+                try:
+                    await asyncio.wait((send,), timeout=self.gate_hold)
+                except asyncio.CancelledError:
+                    send.cancel()
+                    raise
+                finally:
+                    self._gate.release()
+
+                try:
+                    sent = await send
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.stats["failed"] += len(group)
+                    for message in group:
+                        if not message.future.done():
+                            message.future.set_exception(e)
+                else:
+                    self.stats["sent"] += 1
+                    self.stats["batched"] += len(group) - 1
+                    for message in group:
+                        if not message.future.done():
+                            message.future.set_result(sent)
+        finally:
+            for message in queue + group:
+                message.future.cancel()  # Does nothing to the messages that were already sent
+            del self._queues[channel.id], self._workers[channel.id]
+
+    def close(self) -> None:
+        """Cancels every queued message"""
+        for worker in list(self._workers.values()):
+            worker.cancel()
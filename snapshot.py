@@ -0,0 +1,86 @@
+"""On-disk snapshot of caches derived at startup, so a restarted bot can pick them up instead of rebuilding them"""
+# Other Imports
+import asyncio
+import json
+import time
+import os
+
+from store import Store
+
+
+class Snapshot:
+    """A versioned json file of named sections, each the json form of one cache.
+
+Cogs `register` a function returning their section, and `get` it back once on boot. The file is read once when
+the snapshot is created, and written every `interval` seconds if a section was marked dirty, and on shutdown.
+The file is ignored if it was written with a different VERSION. Sections derived from the store are only returned
+if nothing has been written to the store since the snapshot was taken."""
+    VERSION = 1
+
+    def __init__(self, store: Store, path: str, *, interval: float = 300.0):
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self._dumps = {}  # section name -> function returning the section, or None to leave it out
+        self._dirty = False
+        self._task = None
+
+        self._sections, self._store_generation = {}, None
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        if data.get("version") == self.VERSION:
+            self._sections, self._store_generation = data["sections"], data["store_generation"]
+        self._store_unchanged = self._store_generation == store.generation()  # Nothing else is running yet
+
+    def register(self, name: str, dump) -> None:
+        """Adds a section, replacing any section of the same name (such as from before a cog was reloaded)"""
+        self._dumps[name] = dump
+
+    def get(self, name: str, *, store_backed: bool = False):
+        """Returns a section as it was saved, or None if there isn't a usable one. Each section can only be taken
+once, so later calls (such as after reconnecting) rebuild the cache from live data instead."""
+        section = self._sections.pop(name, None)
+        if store_backed and not self._store_unchanged:
+            return None
+        return section
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._task = loop.create_task(self._write_periodically())
+
+    def close(self) -> None:
+        """Writes the snapshot one last time, should be called after cogs have saved their changes to the store"""
+        if self._task is not None:
+            self._task.cancel()
+        self._write(self._dump(self.store.run_sync(self.store.generation)))
+
+    async def _write_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._dirty:
+                continue
+            self._dirty = False
+            # The generation has to be read before dumping, so a write in between makes the sections look stale
+            # rather than making stale sections look current
+            generation = await self.store.run(self.store.generation)
+            await asyncio.get_event_loop().run_in_executor(None, self._write, self._dump(generation))
+
+    def _dump(self, store_generation: int) -> dict:
+        sections = {name: dump() for name, dump in self._dumps.items()}
+        return {
+            "version": self.VERSION,
+            "written_at": time.time(),
+            "store_generation": store_generation,
+            "sections": {name: section for name, section in sections.items() if section is not None},
+        }
+
+    def _write(self, data: dict) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,202 @@
+"""Startup timing, and cogs that are only imported once one of their commands is used"""
+# Discord Imports
+from discord.ext import commands
+
+# Other Imports
+from utils import StatusType
+import time
+import ast
+import os
+
+COMMAND_DECORATORS = {"command", "group"}
+STUB_OPTIONS = ("name", "aliases", "brief", "description", "help", "hidden")
+
+
+def process_start() -> float:
+    """Returns when this process started as a `time.time()` timestamp, or now if that can't be told"""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class StartupTimer:
+    """Records how long each phase of startup took, from the start of the process until the bot is ready.
+The first gateway connection is marked as the bot sends its IDENTIFY."""
+    def __init__(self):
+        self.started_at = process_start()
+        self.phases = []  # (name, seconds taken)
+        self._last = self.started_at
+        self._bot = None
+
+    def mark(self, name: str) -> None:
+        """Ends the current phase, naming it"""
+        now = time.time()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        lines = [f"{name}: {seconds:.3f}s" for name, seconds in self.phases]
+        lines.append(f"Total: {self._last - self.started_at:.3f}s")
+        return "Startup timing\n" + "\n".join(lines)
+
+    def attach(self, bot: commands.Bot) -> None:
+        self._bot = bot
+        bot.add_listener(self.on_connect, "on_connect")
+        bot.add_listener(self.on_ready, "on_ready")
+
+    async def on_connect(self):
+        self._bot.remove_listener(self.on_connect, "on_connect")
+        self.mark("Connecting to the gateway (until IDENTIFY)")
+
+    async def on_ready(self):
+        self._bot.remove_listener(self.on_ready, "on_ready")
+        self.mark("Receiving guilds (until ready)")
+        self._bot.logger.write(status=StatusType.OK, message=self.report())
+
+
+def _dotted(node) -> str:
+    """Returns the dotted name an expression refers to, such as `commands.Cog.listener`"""
+    if isinstance(node, ast.Attribute):
+        return f"{_dotted(node.value)}.{node.attr}"
+    return node.id if isinstance(node, ast.Name) else ""
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def read_commands(path: str):
+    """Returns the name of the cog in a cog file and the options of its top level commands, read from its source
+without importing it. The options of a group hold the options of its subcommands under `subcommands`. Commands
+with checks (other decorators, or a `cog_check`) are hidden, since help can't run their checks until the cog loads
+and would otherwise list them to everyone. Returns None
+if the cog can't be loaded lazily: it has listeners (which have to be registered at startup), more than one cog, or
+commands whose options aren't plain literals."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+
+    cogs = [node for node in tree.body if isinstance(node, ast.ClassDef)
+            and any(_dotted(base) in ("commands.Cog", "Cog") for base in node.bases)]
+    if len(cogs) != 1:
+        return None
+    cog = cogs[0]
+    cog_name = next((_literal(keyword.value) for keyword in cog.keywords if keyword.arg == "name"), cog.name)
+
+    has_cog_check = any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == "cog_check"
+                        for node in cog.body)
+    stubs, groups = [], {}
+    for node in cog.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            call = decorator if isinstance(decorator, ast.Call) else None
+            target = _dotted(call.func if call else decorator)
+            if target.endswith("listener"):
+                return None
+            parent, _, kind = target.rpartition(".")
+            if kind not in COMMAND_DECORATORS or (parent != "commands" and parent not in groups):
+                continue
+
+            options = {"name": node.name, "help": ast.get_docstring(node)}
+            if has_cog_check or len(node.decorator_list) > 1:
+                options["hidden"] = True
+            for keyword in call.keywords if call else ():
+                if keyword.arg in STUB_OPTIONS:
+                    value = _literal(keyword.value)
+                    if value is None:
+                        return None
+                    options[keyword.arg] = value
+            if kind == "group":
+                options["subcommands"] = groups[node.name] = []
+            (stubs if parent == "commands" else groups[parent]).append(options)
+    return cog_name, stubs
+
+
+class StubCommand(commands.Command):
+    """Stands in for a command of a cog that hasn't been loaded yet. Invoking it loads the cog and invokes the real
+command on the same context, so the command events and metrics see a single invocation of the real command."""
+    def __init__(self, func, *, lazy_cogs: "LazyCogs", extension: str, **kwargs):
+        super().__init__(func, **kwargs)
+        self.lazy_cogs = lazy_cogs
+        self.extension = extension
+
+    async def invoke(self, ctx):
+        await self.lazy_cogs.load(self.extension)
+        # Parse the message again now that the real command exists, and carry on as it
+        real = await ctx.bot.get_context(ctx.message)
+        if real.command is None:
+            raise commands.CommandNotFound(f'Command "{ctx.invoked_with}" is not found')
+        ctx.command, ctx.view, ctx.invoked_with = real.command, real.view, real.invoked_with
+        await ctx.command.invoke(ctx)
+
+
+class StubGroup(StubCommand, commands.Group):
+    """A stub for a group, holding stubs of its subcommands so they show up in help"""
+
+
+async def _stub_callback(cog, ctx, *, arguments: str = None):
+    """Never called, stubs are invoked through `StubCommand.invoke`"""
+
+
+def _build_stub(options: dict, parent: StubGroup = None, **kwargs) -> StubCommand:
+    options = dict(options)
+    subcommands = options.pop("subcommands", None)
+    if subcommands is None:
+        return StubCommand(_stub_callback, parent=parent, **options, **kwargs)
+    # Subcommands are given their parent up front like `group.command()` does, so copying the cog keeps it
+    group = StubGroup(_stub_callback, parent=parent, **options, **kwargs)
+    for subcommand in subcommands:
+        group.add_command(_build_stub(subcommand, group, **kwargs))
+    return group
+
+
+class LazyCogs:
+    """Stands in for command-only cogs with stub commands of the same names, so their imports (and whatever those
+pull in) are skipped at startup. The first use of a stub loads the real cog and runs the real command instead."""
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.pending = {}  # extension -> name of its stub cog
+
+    def register(self, extension: str, path: str) -> bool:
+        """Adds stubs for an extension's commands, returns False if it has to be loaded now instead"""
+        read = read_commands(path)
+        if read is None or not read[1]:
+            return False
+        cog_name, stubs = read
+
+        # Subcommands are class attributes too, as in a real cog, so they're given the stub cog
+        attrs = {}
+        for options in stubs:
+            stub = _build_stub(options, lazy_cogs=self, extension=extension)
+            for command in [stub, *stub.walk_commands()] if isinstance(stub, commands.Group) else [stub]:
+                attrs[f"stub_{len(attrs)}"] = command
+        stub_cog = commands.CogMeta(f"Lazy{cog_name.replace(' ', '')}", (commands.Cog,), attrs, name=cog_name)
+        self.bot.add_cog(stub_cog())
+        self.pending[extension] = cog_name
+        return True
+
+    async def load(self, extension: str) -> None:
+        """Swaps an extension's stubs for the real cog, does nothing if it's already loaded"""
+        cog_name = self.pending.pop(extension, None)
+        if cog_name is None:
+            return
+        stub_cog = self.bot.get_cog(cog_name)
+        self.bot.remove_cog(cog_name)
+        started = time.perf_counter()
+        try:
+            self.bot.load_extension(extension)
+        except Exception:
+            # Put the stubs back, so the commands are still there to try again
+            self.bot.add_cog(stub_cog)
+            self.pending[extension] = cog_name
+            raise
+        self.bot.logger.write(status=StatusType.OK,
+                              message=f"Loaded {extension} on first use in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,223 @@
+"""SQLite backed storage shared by every cog"""
+# Other Imports
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import asyncio
+import sqlite3
+import json
+import os
+
+
+class Table(ABC):
+    """A single feature's table, every query runs on the store's executor"""
+    name = ""
+    schema = ""
+
+    def __init__(self, store: "Store"):
+        self._store = store
+
+    @abstractmethod
+    def import_json(self, conn: sqlite3.Connection, data: dict) -> None:
+        """Imports the contents of the feature's old json file, runs inside the migration transaction"""
+
+
+class RoleMenuTable(Table):
+    """Reaction role menus, stored as the menu's ids and a json object of emoji -> role id"""
+    name = "role_menus"
+    schema = """CREATE TABLE IF NOT EXISTS role_menus (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    roles TEXT NOT NULL
+)"""
+
+    def _all(self) -> list:
+        rows = self._store.conn.execute("SELECT channel_id, message_id, roles FROM role_menus").fetchall()
+        return [(channel_id, message_id, json.loads(roles)) for channel_id, message_id, roles in rows]
+
+    def _upsert(self, conn: sqlite3.Connection, channel_id: int, message_id: int, roles: dict) -> None:
+        conn.execute("""INSERT INTO role_menus (message_id, channel_id, roles) VALUES (?, ?, ?)
+ON CONFLICT (message_id) DO UPDATE SET channel_id = excluded.channel_id, roles = excluded.roles""",
+                     (message_id, channel_id, json.dumps(roles)))
+
+    def _delete(self, message_id: int) -> bool:
+        with self._store.transaction() as conn:
+            return conn.execute("DELETE FROM role_menus WHERE message_id = ?", (message_id,)).rowcount > 0
+
+    def import_json(self, conn: sqlite3.Connection, data: dict) -> None:
+        for full_id, roles in data.items():
+            channel_id, message_id = full_id.split("-")
+            self._upsert(conn, int(channel_id), int(message_id), roles)
+
+    async def all(self) -> list:
+        """Returns a list of (channel id, message id, {emoji: role id}) for every saved menu"""
+        return await self._store.run(self._all)
+
+    async def upsert(self, channel_id: int, message_id: int, roles: dict) -> None:
+        """Saves a menu, replacing any existing menu on the same message"""
+        def upsert():
+            with self._store.transaction() as conn:
+                self._upsert(conn, channel_id, message_id, roles)
+        await self._store.run(upsert)
+
+    async def delete(self, message_id: int) -> bool:
+        """Deletes a menu, returns whether there was a menu to delete"""
+        return await self._store.run(self._delete, message_id)
+
+
+class VentChannelTable(Table):
+    """Channels that anonymous messages can be sent to, per guild"""
+    name = "vent_channels"
+    schema = """CREATE TABLE IF NOT EXISTS vent_channels (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, channel_id)
+)"""
+
+    def _all(self) -> dict:
+        channels = {}
+        for guild_id, channel_id in self._store.conn.execute("SELECT guild_id, channel_id FROM vent_channels"):
+            channels.setdefault(guild_id, []).append(channel_id)
+        return channels
+
+    def _add(self, conn: sqlite3.Connection, guild_id: int, channel_id: int) -> bool:
+        return conn.execute("INSERT OR IGNORE INTO vent_channels (guild_id, channel_id) VALUES (?, ?)",
+                            (guild_id, channel_id)).rowcount > 0
+
+    def _remove(self, conn: sqlite3.Connection, guild_id: int, channel_id: int) -> bool:
+        return conn.execute("DELETE FROM vent_channels WHERE guild_id = ? AND channel_id = ?",
+                            (guild_id, channel_id)).rowcount > 0
+
+    def import_json(self, conn: sqlite3.Connection, data: dict) -> None:
+        for guild_id, channel_ids in data.items():
+            for channel_id in channel_ids:
+                self._add(conn, int(guild_id), int(channel_id))
+
+    async def all(self) -> dict:
+        """Returns a dict of a guild id to a list of channel ids"""
+        return await self._store.run(self._all)
+
+    async def add(self, guild_id: int, channel_id: int) -> bool:
+        """Saves a channel, returns whether it wasn't already saved"""
+        def add():
+            with self._store.transaction() as conn:
+                return self._add(conn, guild_id, channel_id)
+        return await self._store.run(add)
+
+    async def remove(self, guild_id: int, channel_id: int) -> bool:
+        """Removes a channel, returns whether it was saved"""
+        def remove():
+            with self._store.transaction() as conn:
+                return self._remove(conn, guild_id, channel_id)
+        return await self._store.run(remove)
+
+    def apply_changes(self, changes: dict) -> None:
+        """Saves a batch of changes in one transaction, `changes` is a dict of (guild id, channel id) -> whether the
+channel was added (True) or removed (False). Blocks, so should only be called through `Store.run`/`Store.run_sync`"""
+        with self._store.transaction() as conn:
+            for (guild_id, channel_id), added in changes.items():
+                if added:
+                    self._add(conn, guild_id, channel_id)
+                else:
+                    self._remove(conn, guild_id, channel_id)
+
+
+class WelcomerConfigTable(Table):
+    """Each guild's welcomer settings, stored as a json object so new settings don't need a new column"""
+    name = "welcomer_config"
+    schema = """CREATE TABLE IF NOT EXISTS welcomer_config (
+    guild_id INTEGER PRIMARY KEY,
+    settings TEXT NOT NULL
+)"""
+
+    def _all(self) -> dict:
+        rows = self._store.conn.execute("SELECT guild_id, settings FROM welcomer_config").fetchall()
+        return {guild_id: json.loads(settings) for guild_id, settings in rows}
+
+    def _upsert(self, conn: sqlite3.Connection, guild_id: int, settings: dict) -> None:
+        conn.execute("""INSERT INTO welcomer_config (guild_id, settings) VALUES (?, ?)
+ON CONFLICT (guild_id) DO UPDATE SET settings = excluded.settings""", (guild_id, json.dumps(settings)))
+
+    def import_json(self, conn: sqlite3.Connection, data: dict) -> None:
+        for guild_id, settings in data.items():
+            self._upsert(conn, int(guild_id), settings)
+
+    async def all(self) -> dict:
+        """Returns a dict of a guild id to its settings, for every guild with settings saved"""
+        return await self._store.run(self._all)
+
+    async def upsert(self, guild_id: int, settings: dict) -> None:
+        """Saves a guild's settings, replacing any it had"""
+        def upsert():
+            with self._store.transaction() as conn:
+                self._upsert(conn, guild_id, settings)
+        await self._store.run(upsert)
+
+
+class Store:
+    """The bot's persistent state, kept in a single SQLite database in WAL mode.
+Queries run on a single background thread so they never block the event loop."""
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY)")
+
+        self.role_menus = RoleMenuTable(self)
+        self.vent_channels = VentChannelTable(self)
+        self.welcomer_config = WelcomerConfigTable(self)
+        self.tables = [self.role_menus, self.vent_channels, self.welcomer_config]
+        for table in self.tables:
+            self.conn.execute(table.schema)
+
+    @contextmanager
+    def transaction(self):
+        """Runs the enclosed queries atomically, rolling back if anything raises. Every committed transaction moves
+the store on to its next generation."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+            self.conn.execute(f"PRAGMA user_version = {self.generation() + 1}")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+
+    def generation(self) -> int:
+        """Returns a number that changes whenever anything is written to the store, in any process. Only reads the
+database header so it's cheap, but it still blocks, so call it through `run`/`run_sync` once the bot is running."""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    async def run(self, func, *args):
+        """Runs a blocking function on the store's thread"""
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def run_sync(self, func, *args):
+        """Runs a blocking function on the store's thread and waits for it, for use outside of the event loop"""
+        return self._executor.submit(func, *args).result()
+
+    def migrate_json(self, resources_dir: str) -> None:
+        """Imports each table's old `<table name>.json` file once, even with several workers migrating the same
+database at once. The json files are left as they are."""
+        for table in self.tables:
+            file_name = f"{table.name}.json"
+            file_dir = os.path.join(os.path.abspath(resources_dir), file_name)
+            if not os.path.exists(file_dir):
+                continue
+            if self.conn.execute("SELECT 1 FROM migrations WHERE name = ?", (file_name,)).fetchone():
+                continue
+
+            with open(file_dir, "r") as f:
+                data = json.load(f)
+            with self.transaction() as conn:
+                # Checked again now the write lock is held, another worker may have imported it since
+                if not conn.execute("SELECT 1 FROM migrations WHERE name = ?", (file_name,)).fetchone():
+                    table.import_json(conn, data)
+                    conn.execute("INSERT INTO migrations (name) VALUES (?)", (file_name,))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.conn.close()
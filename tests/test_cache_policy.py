@@ -0,0 +1,122 @@
+import asyncio
+
+import discord
+
+from cache_policy import CachePolicy
+from guild_index import MutualGuildIndex
+
+
+class StubGuild:
+    """A guild with no cached members, where `members` are the ids fetching finds"""
+    def __init__(self, guild_id: int, members=(), chunked: bool = False):
+        self.id = guild_id
+        self.members = set(members)
+        self.chunked = chunked
+        self.fetches = 0
+
+    def get_member(self, user_id):
+        return None
+
+    async def fetch_member(self, user_id):
+        self.fetches += 1
+        if user_id not in self.members:
+            raise discord.NotFound(type("Response", (), {"status": 404, "reason": "Not Found"})(), "Unknown Member")
+        return type("Member", (), {"id": user_id, "guild": self})()
+
+
+class StubIndex:
+    def guild_ids(self, user_id):
+        return frozenset()
+
+
+def make_policy(guilds, **options):
+    policy = CachePolicy("minimal", **options)
+    policy.bot = type("Bot", (), {"guilds": guilds, "mutual_guilds": StubIndex()})()
+    return policy
+
+
+def test_get_member_remembers_members_and_absent_users():
+    guild = StubGuild(1, members={10})
+    policy = make_policy([guild])
+
+    async def main():
+        for _ in range(3):
+            assert (await policy.get_member(guild, 10)).id == 10
+            assert await policy.get_member(guild, 20) is None
+
+    asyncio.run(main())
+    assert guild.fetches == 2
+    assert policy.stats["fetched_hits"] == 2 and policy.stats["absent_hits"] == 2
+
+
+def test_remembered_results_expire():
+    guild = StubGuild(1, members={10})
+    policy = make_policy([guild], fetched_ttl=0)
+
+    async def main():
+        await policy.get_member(guild, 10)
+        await policy.get_member(guild, 10)
+        await policy.get_member(guild, 20)
+        await policy.get_member(guild, 20)
+
+    asyncio.run(main())
+    assert guild.fetches == 4
+
+
+def test_forget_fetches_again():
+    guild = StubGuild(1, members={10})
+    policy = make_policy([guild])
+
+    async def main():
+        await policy.get_member(guild, 10)
+        policy.forget(1, 10)
+        await policy.get_member(guild, 10)
+
+    asyncio.run(main())
+    assert guild.fetches == 2
+
+
+def test_mutual_guilds_only_fetches_each_guild_once_per_ttl():
+    guilds = [StubGuild(guild_id, members={10} if guild_id % 2 else ()) for guild_id in range(1, 21)]
+    policy = make_policy(guilds)
+
+    async def main():
+        return [await policy.mutual_guilds(10) for _ in range(5)]
+
+    results = asyncio.run(main())
+    assert all(sorted(guild.id for guild in result) == list(range(1, 21, 2)) for result in results)
+    assert sum(guild.fetches for guild in guilds) == 20
+
+
+def test_absent_users_are_bounded():
+    guild = StubGuild(1)
+    policy = make_policy([guild], max_absent=5)
+
+    async def main():
+        for user_id in range(20):
+            await policy.get_member(guild, user_id)
+
+    asyncio.run(main())
+    assert len(policy._absent) == 5
+
+
+def test_mutual_guilds_only_checks_the_given_guilds():
+    guilds = [StubGuild(guild_id, members={10}) for guild_id in range(1, 21)]
+    policy = make_policy(guilds)
+
+    async def main():
+        return await policy.mutual_guilds(10, guilds[:3])
+
+    assert [guild.id for guild in asyncio.run(main())] == [1, 2, 3]
+    assert sum(guild.fetches for guild in guilds) == 3
+
+
+def test_index_forgets_uncached_members_that_leave():
+    bot = type("Bot", (), {"add_listener": lambda self, listener, name: None, "guilds": []})()
+    index = MutualGuildIndex(bot)
+    member = type("Member", (), {"id": 10, "guild": StubGuild(1)})()
+    index.add_member(member)
+    index.add_member(type("Member", (), {"id": 10, "guild": StubGuild(2)})())
+
+    asyncio.run(index.on_uncached_member_remove(member.guild, member))
+    assert index.guild_ids(10) == {2}
@@ -0,0 +1,77 @@
+import asyncio
+
+from cogs.confess import AnonChannelHandler
+
+
+class StubChannel:
+    def __init__(self, guild_id: int, channel_id: int):
+        self.guild = type("Guild", (), {"id": guild_id})()
+        self.id = channel_id
+
+
+class StubVentChannels:
+    def __init__(self, saved=None, failures: int = 0):
+        self.saved = saved or {}
+        self.failures = failures
+        self.applied = []
+
+    async def all(self):
+        await asyncio.sleep(0)
+        return self.saved
+
+    def apply_changes(self, changes):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.applied.append(dict(changes))
+
+
+class StubStore:
+    def __init__(self, vent_channels):
+        self.vent_channels = vent_channels
+
+    async def run(self, func, *args):
+        await asyncio.sleep(0)
+        return func(*args)
+
+
+class StubBot:
+    def __init__(self, vent_channels):
+        self.loop = asyncio.get_event_loop()
+        self.store = StubStore(vent_channels)
+        self.snapshot = type("Snapshot", (), {"get": lambda self, *args, **kwargs: None,
+                                              "mark_dirty": lambda self: None})()
+        self.logs = []
+        self.logger = type("Logger", (), {"write": lambda _, **entry: self.logs.append(entry)})()
+
+
+def test_failed_background_flush_is_logged_and_retried():
+    vent_channels = StubVentChannels(failures=1)
+
+    async def main():
+        bot = StubBot(vent_channels)
+        handler = AnonChannelHandler(bot, flush_delay=0)
+        handler.add_channel(StubChannel(1, 10))
+        await handler._flush_task
+        assert bot.logs and not vent_channels.applied
+        await handler._flush_task
+        return handler
+
+    handler = asyncio.run(main())
+    assert vent_channels.applied == [{(1, 10): True}]
+    assert not handler._unsaved
+
+
+def test_load_keeps_changes_made_before_it_finished():
+    vent_channels = StubVentChannels(saved={"1": [10, 11]})
+
+    async def main():
+        bot = StubBot(vent_channels)
+        handler = AnonChannelHandler(bot, flush_delay=60)
+        handler.add_channel(StubChannel(1, 12))
+        await handler.load()
+        handler._flush_task.cancel()
+        return handler
+
+    handler = asyncio.run(main())
+    assert handler._channels == {1: {10, 11, 12}}
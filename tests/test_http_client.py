@@ -0,0 +1,81 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from http_client import HTTPClient
+
+
+def make_app(state: dict) -> web.Application:
+    async def flaky(request):
+        state["flaky"] += 1
+        if state["flaky"] <= 2:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        return web.Response(text="ok")
+
+    async def down(request):
+        state["down"] += 1
+        return web.Response(status=503)
+
+    async def slow(request):
+        state["active"] += 1
+        state["most_active"] = max(state["most_active"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        return web.Response(text=request.headers["User-Agent"])
+
+    app = web.Application()
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/down", down)
+    app.router.add_get("/slow", slow)
+    return app
+
+
+def run_against_server(test) -> dict:
+    state = {"flaky": 0, "down": 0, "active": 0, "most_active": 0}
+
+    async def main():
+        async with TestServer(make_app(state)) as server:
+            client = HTTPClient(retries=3, backoff=0, limit_per_host=2, user_agent="tests")
+            try:
+                await test(client, server)
+            finally:
+                await client.close()
+
+    asyncio.run(main())
+    return state
+
+
+def test_failed_responses_are_retried_until_one_succeeds():
+    async def test(client, server):
+        response = await client.get(str(server.make_url("/flaky")))
+        assert response.status == 200 and response.text == "ok"
+
+    assert run_against_server(test)["flaky"] == 3
+
+
+def test_last_failed_response_is_returned_once_out_of_retries():
+    async def test(client, server):
+        assert (await client.get(str(server.make_url("/down")))).status == 503
+
+    assert run_against_server(test)["down"] == 4
+
+
+def test_requests_to_one_host_are_limited():
+    async def test(client, server):
+        responses = await asyncio.gather(*(client.get(str(server.make_url("/slow"))) for _ in range(6)))
+        assert {response.text for response in responses} == {"tests"}
+
+    assert run_against_server(test)["most_active"] == 2
+
+
+def test_connection_errors_are_raised_once_out_of_retries():
+    async def test(client, server):
+        url = str(server.make_url("/flaky"))
+        await server.close()
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await client.get(url)
+
+    run_against_server(test)
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+import glob
+
+import discord.ext.commands  # noqa: F401, utils uses it without importing it, like it's used in main.py
+import pytest
+
+from utils import Logger, LogReader, StatusType
+
+DAY = 24 * 60 * 60
+
+
+def archives(path) -> list:
+    return glob.glob(f"{path}.*.gz")
+
+
+@pytest.mark.parametrize("log_format", ["text", "json"])
+def test_old_log_is_rotated_after_a_restart(tmp_path, log_format):
+    path = tmp_path / "bot.log"
+    old_entry = (datetime.now() - timedelta(days=8), StatusType.OK, "Written before the restart")
+    formatter = Logger.format_text if log_format == "text" else Logger.format_json
+    path.write_text(formatter(*old_entry), encoding="utf-8")
+
+    logger = Logger(None, str(path), log_format=log_format, max_age=7 * DAY)
+    logger.write(status=StatusType.OK, message="Written after the restart")
+    logger.close()
+    assert len(archives(path)) == 1
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("log_format", ["text", "json"])
+def test_recent_log_is_kept_after_a_restart(tmp_path, log_format):
+    path = tmp_path / "bot.log"
+    for message in ("Before the restart", "After the restart"):
+        logger = Logger(None, str(path), log_format=log_format, max_age=7 * DAY)
+        logger.write(status=StatusType.OK, message=message)
+        logger.close()
+
+    assert archives(path) == []
+    assert [entry.message for entry in LogReader(str(path)).read()] == ["After the restart", "Before the restart"]
+
+
+def test_new_log_is_rotated_by_size(tmp_path):
+    path = tmp_path / "bot.log"
+    logger = Logger(None, str(path), max_bytes=1024)
+    for number in range(20):
+        logger.write(status=StatusType.OK, message=f"Entry {number} " + "x" * 100)
+    logger.close()
+    assert archives(path)
@@ -0,0 +1,35 @@
+import asyncio
+
+import discord.ext.commands  # noqa: F401, utils needs discord.ext.commands imported first
+
+from main import RoboDart
+
+
+class StubService:
+    def __init__(self, closed: list, name: str):
+        self.closed = closed
+        self.name = name
+
+    def close(self):
+        self.closed.append(self.name)
+
+
+class StubAsyncService(StubService):
+    async def close(self):
+        self.closed.append(self.name)
+
+
+def test_closing_twice_only_closes_the_services_once():
+    closed = []
+
+    async def main():
+        bot = RoboDart(command_prefix="!")
+        for name in ("snapshot", "outbox", "store", "logger"):
+            setattr(bot, name, StubService(closed, name))
+        for name in ("cluster", "web_server", "http_client"):
+            setattr(bot, name, StubAsyncService(closed, name))
+        await asyncio.gather(bot.close(), bot.close())
+        await bot.close()
+
+    asyncio.run(main())
+    assert closed == ["snapshot", "outbox", "cluster", "web_server", "http_client", "store", "logger"]
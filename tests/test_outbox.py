@@ -0,0 +1,94 @@
+import asyncio
+
+import discord.ext.commands  # noqa: F401, utils needs discord.ext.commands imported first
+
+from main import ReplyContext
+from outbox import Outbox, Priority
+
+
+class StubChannel:
+    def __init__(self, channel_id: int = 1):
+        self.id = channel_id
+        self.sent = []
+        self.release = None
+
+    async def send(self, content=None, **kwargs):
+        if self.release is not None:
+            await self.release.wait()
+        self.sent.append(content)
+        return content
+
+
+def test_queued_messages_go_out_by_priority():
+    channel = StubChannel()
+
+    async def main():
+        outbox = Outbox()
+        channel.release = asyncio.Event()
+        first = outbox.send(channel, "first", priority=Priority.BULK)
+        await asyncio.sleep(0)  # The first message is now being sent, the rest queue behind it
+        futures = [outbox.send(channel, "bulk", priority=Priority.BULK),
+                   outbox.send(channel, "reply"),
+                   outbox.send(channel, "moderation", priority=Priority.MODERATION)]
+        assert outbox.depth() == {Priority.MODERATION: 1, Priority.REPLY: 1, Priority.BULK: 1}
+        channel.release.set()
+        await asyncio.gather(first, *futures)
+
+    asyncio.run(main())
+    assert channel.sent == ["first", "moderation", "reply", "bulk"]
+
+
+def test_batched_messages_are_joined():
+    channel = StubChannel()
+
+    async def main():
+        outbox = Outbox()
+        channel.release = asyncio.Event()
+        first = outbox.send(channel, "first")
+        await asyncio.sleep(0)
+        futures = [outbox.send(channel, str(number), priority=Priority.BULK, batch=True) for number in range(3)]
+        channel.release.set()
+        return outbox, await asyncio.gather(first, *futures)
+
+    outbox, results = asyncio.run(main())
+    assert channel.sent == ["first", "0\n1\n2"]
+    assert results[1:] == ["0\n1\n2"] * 3
+    assert outbox.stats == {"sent": 2, "batched": 2, "failed": 0}
+
+
+def test_command_replies_go_through_the_outbox_as_replies():
+    channel = StubChannel()
+
+    async def main():
+        outbox = Outbox()
+        bot = type("Bot", (), {"outbox": outbox})()
+        message = type("Message", (), {"channel": channel, "_state": None})()
+        ctx = ReplyContext(message=message, prefix="!", bot=bot)
+        channel.release = asyncio.Event()
+        first = outbox.send(channel, "first", priority=Priority.BULK)
+        await asyncio.sleep(0)
+        reply = asyncio.ensure_future(ctx.send("reply"))
+        await asyncio.sleep(0)
+        assert outbox.depth()[Priority.REPLY] == 1
+        channel.release.set()
+        await first
+        return await reply
+
+    assert asyncio.run(main()) == "reply"
+    assert channel.sent == ["first", "reply"]
+
+
+def test_rate_limited_channels_dont_hold_up_other_channels():
+    limited, other = StubChannel(1), StubChannel(2)
+
+    async def main():
+        outbox = Outbox(concurrency=1, gate_hold=0.01)
+        limited.release = asyncio.Event()  # Stands in for discord.py waiting out the channel's rate limit
+        waiting = outbox.send(limited, "welcome", priority=Priority.BULK)
+        await asyncio.sleep(0)
+        await asyncio.wait_for(outbox.send(other, "moderation", priority=Priority.MODERATION), 1)
+        limited.release.set()
+        await waiting
+
+    asyncio.run(main())
+    assert other.sent == ["moderation"] and limited.sent == ["welcome"]
@@ -0,0 +1,139 @@
+import asyncio
+
+from discord.ext import commands
+import pytest
+
+from cogs.reaction_roles import RoleEditBuffer, menu_id
+
+
+class StubRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+    def is_default(self):
+        return False
+
+
+class StubMember:
+    def __init__(self, member_id: int, role_ids):
+        self.id = member_id
+        self.roles = [StubRole(role_id) for role_id in role_ids]
+        self.edits = []
+
+    async def edit(self, *, roles):
+        self.edits.append({role.id for role in roles})
+
+
+class StubCachePolicy:
+    def __init__(self, member):
+        self.member = member
+        self.forgotten = []
+
+    async def get_member(self, guild, user_id):
+        return self.member
+
+    def forget(self, guild_id, user_id):
+        self.forgotten.append((guild_id, user_id))
+
+
+class StubBot:
+    def __init__(self, member):
+        self.loop = asyncio.get_event_loop()
+        self.guild = type("Guild", (), {"id": 1})()
+        self.cache_policy = StubCachePolicy(member)
+        self.snapshot = type("Snapshot", (), {"register": lambda self, name, dump: None,
+                                              "mark_dirty": lambda self: None})()
+        self.logs = []
+        self.logger = type("Logger", (), {"write": lambda _, **entry: self.logs.append(entry)})()
+
+    def get_guild(self, guild_id):
+        return self.guild
+
+
+def test_menu_id_accepts_full_and_message_ids():
+    assert menu_id("123-456") == (123, 456)
+    assert menu_id(" 456 ") == (None, 456)
+
+
+@pytest.mark.parametrize("argument", ["abc", "123-", "12-ab", "1-2-3"])
+def test_menu_id_rejects_bad_ids(argument):
+    with pytest.raises(commands.BadArgument):
+        menu_id(argument)
+
+
+def test_role_changes_are_coalesced_into_one_edit_and_forget_the_member():
+    member = StubMember(10, {100, 101})
+    member.guild = type("Guild", (), {"id": 1})()
+
+    async def main():
+        bot = StubBot(member)
+        buffer = RoleEditBuffer(bot, delay=0)
+        buffer.add_role(member, 102)
+        buffer.remove_role(member, 100)
+        buffer.add_role(member, 103)
+        await asyncio.gather(*buffer._tasks.values())
+        return bot, buffer
+
+    bot, buffer = asyncio.run(main())
+    assert member.edits == [{101, 102, 103}]
+    assert buffer.stats["edits"] == 1 and buffer.stats["coalesced"] == 2
+    # The cached member is out of date after the edit, so it mustn't be used for the next one
+    assert bot.cache_policy.forgotten == [(1, 10)]
+
+
+def test_startup_doesnt_reconcile_under_the_minimal_policy():
+    from cogs.reaction_roles import ReactionRoles
+
+    async def main():
+        bot = StubBot(None)
+        bot.cache_policy.name = "minimal"
+        cog = ReactionRoles(bot)
+
+        async def run(**kwargs):
+            raise AssertionError("reconciled at startup")
+        cog.reconciler.run = run
+        await cog.startup_checks()
+        return bot
+
+    assert asyncio.run(main()).logs
+
+
+def test_reconcile_drops_menus_whose_message_was_deleted():
+    import discord
+    from cogs.reaction_roles import MenuReconciler, RoleMenu, RoleMenuRegistry
+
+    class DeletedMessageChannel:
+        async def fetch_message(self, message_id):
+            raise discord.NotFound(type("Response", (), {"status": 404, "reason": "Not Found"})(), "Unknown Message")
+
+    async def main():
+        bot = StubBot(None)
+        bot.get_channel = lambda channel_id: DeletedMessageChannel()
+        menus = RoleMenuRegistry()
+        menus.add(RoleMenu(1, 2, 3, {"a": 4}))
+        await MenuReconciler(bot, menus).run()
+        return menus
+
+    assert len(asyncio.run(main())) == 0
+
+
+def test_menus_on_other_workers_are_skipped_without_warnings():
+    from cluster import Cluster
+    from cogs.reaction_roles import ReactionRoles
+
+    class StubRoleMenus:
+        async def all(self):
+            return [(20, 30, {"a": 4})]
+
+    async def main():
+        bot = StubBot(None)
+        bot.cluster = Cluster(worker_id=0, workers=2, shard_count=2)
+        bot.get_channel = lambda channel_id: None
+        bot.store = type("Store", (), {"role_menus": StubRoleMenus()})()
+        cog = ReactionRoles(bot)
+        cog.load_snapshot({"menus": [[1 << 22, 20, 30, {"a": 4}]]})  # A guild on shard 1, so on worker 1
+        await cog.load_role_menus()
+        return bot, cog
+
+    bot, cog = asyncio.run(main())
+    assert not bot.logs and not len(cog.menus)
@@ -0,0 +1,99 @@
+import asyncio
+
+import discord.ext.commands  # noqa: F401, utils needs discord.ext.commands imported first
+from discord.ext import commands
+import pytest
+
+from startup import LazyCogs, read_commands
+
+COG_SOURCE = '''
+from discord.ext import commands
+
+CALLS = []
+
+
+class Tools(commands.Cog, name="Tools"):
+    @commands.group(brief="Tool commands.", invoke_without_command=True)
+    async def tools(self, ctx):
+        """Groups the tools"""
+
+    @tools.command(brief="Echoes its argument.")
+    async def echo(self, ctx, word: str):
+        CALLS.append(word)
+
+    @commands.command(brief="Deletes messages.")
+    @commands.has_permissions(manage_messages=True)
+    async def purge(self, ctx):
+        pass
+
+
+def setup(bot):
+    bot.add_cog(Tools())
+'''
+
+
+class StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+        self.author = type("User", (), {"id": 1})()
+        self._state = None
+
+
+def make_bot(tmp_path, monkeypatch, name: str = "lazy_tools", source: str = COG_SOURCE):
+    (tmp_path / f"{name}.py").write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    bot = commands.Bot(command_prefix="!")
+    bot._connection.user = type("User", (), {"id": 0})()
+    bot.logger = type("Logger", (), {"write": lambda self, **entry: None})()
+    bot.events = []
+    bot.dispatch = lambda event, *args, **kwargs: bot.events.append(event)
+    bot.lazy_cogs = LazyCogs(bot)
+    assert bot.lazy_cogs.register(name, str(tmp_path / f"{name}.py"))
+    return bot
+
+
+def test_read_commands_includes_subcommands(tmp_path):
+    (tmp_path / "lazy_tools.py").write_text(COG_SOURCE)
+    cog_name, stubs = read_commands(str(tmp_path / "lazy_tools.py"))
+    assert cog_name == "Tools"
+    assert [stub["name"] for stub in stubs] == ["tools", "purge"]
+    assert stubs[1]["hidden"] and "hidden" not in stubs[0]
+    assert [subcommand["name"] for subcommand in stubs[0]["subcommands"]] == ["echo"]
+
+
+def test_stub_groups_list_their_subcommands(tmp_path, monkeypatch):
+    async def main():
+        bot = make_bot(tmp_path, monkeypatch)
+        group = bot.get_command("tools")
+        return group, bot.get_command("tools echo")
+
+    group, echo = asyncio.run(main())
+    assert [command.name for command in group.commands] == ["echo"]
+    assert echo.brief == "Echoes its argument." and echo.cog is group.cog
+
+
+def test_first_use_runs_the_real_command_once(tmp_path, monkeypatch):
+    async def main():
+        bot = make_bot(tmp_path, monkeypatch)
+        await bot.invoke(await bot.get_context(StubMessage("!tools echo hello")))
+        return bot
+
+    bot = asyncio.run(main())
+    import lazy_tools
+    assert lazy_tools.CALLS == ["hello"]
+    assert bot.events == ["command", "command_completion"]
+    assert bot.get_cog("Tools").__module__ == "lazy_tools"
+
+
+def test_stubs_are_put_back_if_the_cog_fails_to_load(tmp_path, monkeypatch):
+    source = COG_SOURCE.replace("    bot.add_cog(Tools())", "    raise RuntimeError('broken')")
+
+    async def main():
+        bot = make_bot(tmp_path, monkeypatch, "broken_tools", source)
+        with pytest.raises(commands.ExtensionFailed):
+            await bot.lazy_cogs.load("broken_tools")
+        return bot
+
+    bot = asyncio.run(main())
+    assert bot.get_command("tools echo") is not None
+    assert bot.lazy_cogs.pending == {"broken_tools": "Tools"}
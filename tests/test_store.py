@@ -0,0 +1,25 @@
+import json
+
+import store
+from store import Store
+
+
+def test_workers_migrating_at_once_import_each_file_once(tmp_path, monkeypatch):
+    (tmp_path / "role_menus.json").write_text(json.dumps({"1-2": {"a": 3}}))
+    first, second = Store(str(tmp_path / "bot.db")), Store(str(tmp_path / "bot.db"))
+    load = json.load
+
+    def load_after_first_worker(f):
+        # The second worker has found nothing migrated yet, the first worker then migrates before it
+        monkeypatch.setattr(store.json, "load", load)
+        first.migrate_json(str(tmp_path))
+        return load(f)
+
+    monkeypatch.setattr(store.json, "load", load_after_first_worker)
+    second.migrate_json(str(tmp_path))
+    try:
+        assert second.conn.execute("SELECT name FROM migrations").fetchall() == [("role_menus.json",)]
+        assert second.role_menus._all() == [(1, 2, {"a": 3})]
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,80 @@
+from functools import total_ordering
+
+import cogs.welcomer as welcomer
+from cogs.welcomer import RateCounter, auto_role_problem, create_summary_embed
+
+
+@total_ordering
+class StubRole:
+    def __init__(self, position: int, *, managed: bool = False, default: bool = False):
+        self.position = position
+        self.managed = managed
+        self.default = default
+        self.mention = f"<@&{position}>"
+
+    def is_default(self):
+        return self.default
+
+    def __eq__(self, other):
+        return self.position == other.position
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+
+class StubMember:
+    def __init__(self, member_id: int, top_role: StubRole, guild=None):
+        self.id = member_id
+        self.top_role = top_role
+        self.guild = guild
+        self.mention = f"<@{member_id}>"
+
+
+class StubGuild:
+    def __init__(self, owner_id: int, bot_top_role: StubRole):
+        self.owner_id = owner_id
+        self.me = StubMember(0, bot_top_role)
+        self.member_count = 0
+
+
+def test_auto_roles_must_be_below_the_author_and_the_bot():
+    guild = StubGuild(owner_id=1, bot_top_role=StubRole(10))
+    moderator = StubMember(2, StubRole(5), guild)
+    owner = StubMember(1, StubRole(1), guild)
+
+    assert auto_role_problem(StubRole(4), moderator) is None
+    assert "your highest role" in auto_role_problem(StubRole(5), moderator)
+    assert "your highest role" in auto_role_problem(StubRole(7), moderator)
+    assert "my highest role" in auto_role_problem(StubRole(10), moderator)
+    assert auto_role_problem(StubRole(7), owner) is None  # The owner can hand out any role the bot can
+    assert "my highest role" in auto_role_problem(StubRole(12), owner)
+    assert "managed" in auto_role_problem(StubRole(3, managed=True), owner)
+    assert "managed" in auto_role_problem(StubRole(0, default=True), owner)
+
+
+def test_rate_counter_forgets_old_events(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(welcomer.time, "monotonic", lambda: now[0])
+    counter = RateCounter(60, slots=6, max_keys=2)
+
+    assert [counter.add("a") for _ in range(3)] == [1, 2, 3]
+    now[0] += 30
+    assert counter.add("a") == 4
+    now[0] += 40  # The first three fell out of the window
+    assert counter.add("a") == 2
+    now[0] += 600
+    assert counter.add("a") == 1
+
+    counter.add("b")
+    counter.add("c")
+    assert list(counter._counts) == ["b", "c"]
+
+
+def test_summary_embed_fits_every_member_it_can():
+    guild = StubGuild(owner_id=1, bot_top_role=StubRole(10))
+    users = [StubMember(10 ** 17 + number, None) for number in range(1000)]
+    embed = create_summary_embed("Welcome!", users, guild, 0)
+    assert len(embed.description) <= 4096
+    assert embed.description.endswith("more")
+    shown = embed.description.count("<@")
+    assert f"and {1000 - shown} more" in embed.description
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from http_client import HTTPResponse
+from wiki_cache import WikiCache
+
+PAGE = b"<h1 id='firstHeading'>Python</h1><p>A language.</p>"
+
+
+class StubHTTPClient:
+    """Answers every request with the same page after a short wait, counting the requests"""
+    def __init__(self, status: int = 200, delay: float = 0.05):
+        self.status = status
+        self.delay = delay
+        self.requests = 0
+
+    async def get(self, url, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return HTTPResponse(url, self.status, {"ETag": '"1"'}, PAGE if self.status == 200 else b"")
+
+
+def length(page: bytes) -> int:
+    return len(page)
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path):
+    http_client = StubHTTPClient()
+    cache = WikiCache(http_client, str(tmp_path))
+
+    async def main():
+        return await asyncio.gather(*(cache.get("https://wiki/Python", length) for _ in range(50)))
+
+    results = asyncio.run(main())
+    cache.close()
+    assert http_client.requests == 1
+    assert {result.page for result in results} == {len(PAGE)}
+    assert cache.stats["misses"] == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_concurrent_misses_of_different_pages_are_all_written(tmp_path):
+    http_client = StubHTTPClient(delay=0)
+    cache = WikiCache(http_client, str(tmp_path))
+
+    async def main():
+        return await asyncio.gather(*(cache.get(f"https://wiki/Page_{number}", length, remember=False)
+                                      for number in range(200)))
+
+    results = asyncio.run(main())
+    assert all(result.status == 200 for result in results)
+    assert len(cache._load_disk_sizes()) == 200
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".html")]) == 200
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    # Found on disk the second time, without going back to Wikipedia
+    asyncio.run(cache.get("https://wiki/Page_0", length))
+    cache.close()
+    assert http_client.requests == 200
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_missing_pages_are_cached(tmp_path):
+    http_client = StubHTTPClient(status=404)
+    cache = WikiCache(http_client, str(tmp_path))
+
+    async def main():
+        first = await cache.get("https://wiki/Nothing", length, remember=False)
+        second = await cache.get("https://wiki/Nothing", length, remember=False)
+        return first, second
+
+    first, second = asyncio.run(main())
+    cache.close()
+    assert (first.status, second.status) == (404, 404)
+    assert http_client.requests == 1
+    assert cache.stats["negative_hits"] == 1
+
+
+def test_missing_pages_count_towards_the_disk_limits(tmp_path):
+    http_client = StubHTTPClient(status=404, delay=0)
+    cache = WikiCache(http_client, str(tmp_path), disk_entries=10)
+
+    async def main():
+        for number in range(50):
+            await cache.get(f"https://wiki/Typo_{number}", length, remember=False)
+
+    asyncio.run(main())
+    cache.close()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".json")]) == 10
+    assert cache.stats["evictions"] == 40
@@ -0,0 +1,48 @@
+import gzip
+import tracemalloc
+
+from wiki_offline import iter_dump, build_index, OfflineIndex
+
+
+def write_dump(path, count: int) -> None:
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("<feed>\n")
+        for number in range(count):
+            f.write(f"<doc>\n<title>Wikipedia: Article {number}</title>\n<url>https://en.wikipedia.org/wiki/"
+                    f"Article_{number}</url>\n<abstract>Abstract of article {number}.</abstract>\n<links></links>\n"
+                    f"</doc>\n")
+        f.write("</feed>\n")
+
+
+def test_iter_dump_reads_every_article(tmp_path):
+    dump = tmp_path / "dump.xml.gz"
+    write_dump(dump, 3)
+    assert list(iter_dump(str(dump))) == [(f"Article {number}", f"Abstract of article {number}.")
+                                          for number in range(3)]
+
+
+def test_iter_dump_memory_does_not_grow_with_the_dump(tmp_path):
+    dump = tmp_path / "dump.xml.gz"
+    write_dump(dump, 50_000)
+
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in iter_dump(str(dump)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 50_000
+    assert peak < 1024 * 1024  # Keeping every article attached to the root takes several MiB
+
+
+def test_built_index_finds_articles(tmp_path):
+    dump = tmp_path / "dump.xml.gz"
+    write_dump(dump, 100)
+    assert build_index(str(dump), str(tmp_path / "index"), run_size=30) == 100
+
+    index = OfflineIndex(str(tmp_path / "index"))
+    try:
+        assert index.lookup("article_42") == ("Article 42", "Abstract of article 42.")
+        assert index.lookup("Article 100") is None
+    finally:
+        index.close()
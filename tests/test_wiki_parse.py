@@ -0,0 +1,37 @@
+import pytest
+
+import wiki_parse
+from cogs.wiki import page_title
+
+ARTICLE = (b"<html><body><h1 id='firstHeading'>Python <span class='mw-editsection'>[edit]</span></h1>"
+           b"<p>\n</p><p>Python is a <b>language</b>.</p><h2>History<span class='mw-editsection'>[edit]</span></h2>"
+           b"<p>It was made in 1991.</p></body></html>")
+NO_HEADING = b"<html><body><p>Search results</p></body></html>"
+
+PARSERS = [wiki_parse._parse_stdlib]
+if wiki_parse.etree is not None:
+    PARSERS.append(wiki_parse._parse_lxml)
+
+
+@pytest.mark.parametrize("parse", PARSERS)
+def test_parse_finds_heading_and_paragraphs(parse):
+    assert parse(ARTICLE) == ("Python", ["Python is a language.", "It was made in 1991."])
+    assert parse(ARTICLE, 1) == ("Python", ["Python is a language."])
+
+
+@pytest.mark.parametrize("parse", PARSERS)
+def test_parse_without_heading(parse):
+    assert parse(NO_HEADING) == (None, ["Search results"])
+
+
+def test_page_title_falls_back_to_the_requested_title():
+    assert page_title("Python", "https://en.wikipedia.org/wiki/Python") == "Python"
+    heading, _ = wiki_parse.extract_summary(NO_HEADING)
+    assert page_title(heading, "https://en.wikipedia.org/wiki/Special:Search") == "Special:Search"
+    assert page_title(heading, "https://en.wikipedia.org/wiki/Monty_Python") == "Monty Python"
+
+
+def test_export_without_heading():
+    heading, parts = wiki_parse.export_article(NO_HEADING)
+    assert heading is None
+    assert parts == [b"Search results"]
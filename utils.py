@@ -4,6 +4,13 @@ import discord
 # Other Imports
 from enum import Enum, auto
 from datetime import datetime
+from bisect import bisect_right
+import threading
+import queue
+import json
+import gzip
+import glob
+import time
 import os
 
 
@@ -14,15 +21,246 @@ class StatusType(Enum):
 
 
 class Logger:
-    def __init__(self, bot: discord.ext.commands.Bot, log_file_path: str):
+    """Writes log entries from a background thread, so event handlers never wait on the disk.
+
+Entries are queued by `write` and written in batches, either as the original text blocks (`log_format="text"`)
+or as JSON lines (`log_format="json"`). The log is rotated once it's bigger than `max_bytes` or older than
+`max_age` seconds, old logs are gzipped next to it and only the newest `backups` are kept.
+
+A sparse index of `<timestamp> <byte offset>` lines is kept in `<log file>.idx`, one for roughly every
+`index_every` bytes of log, so `LogReader` can jump to a point in time without reading the whole log."""
+    def __init__(self, bot: discord.ext.commands.Bot, log_file_path: str, *, log_format: str = "text",
+                 max_bytes: int = 10 * 1024 * 1024, max_age: float = 7 * 24 * 60 * 60, backups: int = 10,
+                 batch_size: int = 100, index_every: int = 64 * 1024):
         self._bot = bot
         self.file_dir = log_file_path
+        self.log_format = log_format
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.batch_size = batch_size
+        self.index_every = index_every
+        self.index_dir = f"{log_file_path}.idx"
+
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._started_at = None  # Time of the current log's first entry
+        self._last_indexed = None
+        self._thread = threading.Thread(target=self._run, name="logger", daemon=True)
+        self._thread.start()
 
     def write(self, *, status: StatusType, message: str):
-        new_log_line = f"""[{datetime.now()}]
+        """Queues an entry to be written, returns immediately"""
+        self._queue.put((datetime.now(), status, message))
+
+    def close(self) -> None:
+        """Writes every queued entry and stops the background thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    @staticmethod
+    def format_text(timestamp: datetime, status: StatusType, message: str) -> str:
+        return f"""[{timestamp}]
 [Status: {status}]
 {message}
 ===================================================================================\n"""
-        print(new_log_line)
-        with open(self.file_dir, "a") as f:
-            f.write(new_log_line)
+
+    @staticmethod
+    def format_json(timestamp: datetime, status: StatusType, message: str) -> str:
+        return json.dumps({"time": timestamp.isoformat(), "status": status.name, "message": message}) + "\n"
+
+    # Everything below runs on the background thread
+    def _run(self) -> None:
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+            if batch:
+                self._write_batch(batch)
+        if self._file is not None:
+            self._file.close()
+
+    def _write_batch(self, batch: list) -> None:
+        text_lines = [self.format_text(*record) for record in batch]
+        print("\n".join(text_lines))
+        try:
+            self._open()
+            lines = text_lines if self.log_format == "text" else [self.format_json(*record) for record in batch]
+            self._index(batch, lines)
+            self._file.write("".join(lines))
+            self._file.flush()
+            if self._started_at is None:
+                self._started_at = batch[0][0].timestamp()
+            if self._file.tell() >= self.max_bytes or time.time() - self._started_at >= self.max_age:
+                self._rotate()
+        except OSError as e:
+            print(f"Failed to write to {self.file_dir!r}: {e}")
+
+    def _open(self) -> None:
+        if self._file is None:
+            self._file = open(self.file_dir, "a", encoding="utf-8")
+            # Measured from the log itself so restarting doesn't reset (or skip) age based rotation
+            self._started_at = self._first_entry_time()
+            self._last_indexed = None
+
+    def _first_entry_time(self):
+        """Returns the timestamp of the log's first entry, or None if it's empty or the entry can't be read"""
+        with open(self.file_dir, "r", encoding="utf-8", errors="replace") as f:
+            line = f.readline().strip()
+        try:
+            if line.startswith("{"):
+                return datetime.fromisoformat(json.loads(line)["time"]).timestamp()
+            if line.startswith("[") and line.endswith("]"):
+                return datetime.fromisoformat(line[1:-1]).timestamp()
+        except (ValueError, KeyError):
+            pass
+        return None
+
+    def _index(self, batch: list, lines: list) -> None:
+        """Adds the start of an entry to the index whenever `index_every` bytes have been written since the last"""
+        offset = self._file.tell()
+        points = []
+        for (timestamp, _, _), line in zip(batch, lines):
+            if self._last_indexed is None or offset - self._last_indexed >= self.index_every:
+                points.append(f"{timestamp.timestamp()} {offset}\n")
+                self._last_indexed = offset
+            offset += len(line.encode("utf-8"))
+        if points:
+            with open(self.index_dir, "a") as f:
+                f.write("".join(points))
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        archive_path = f"{self.file_dir}.{datetime.now():%Y%m%d-%H%M%S-%f}.gz"
+        with open(self.file_dir, "rb") as log, gzip.open(archive_path, "wb") as archive:
+            while True:
+                chunk = log.read(1024 * 1024)
+                if not chunk:
+                    break
+                archive.write(chunk)
+        os.remove(self.file_dir)
+        if os.path.exists(self.index_dir):
+            os.remove(self.index_dir)
+
+        archives = sorted(glob.glob(f"{glob.escape(self.file_dir)}.*.gz"))
+        for old_archive in archives[:-self.backups] if self.backups else archives:
+            os.remove(old_archive)
+
+
+class LogEntry:
+    __slots__ = ("timestamp", "status", "message")
+
+    def __init__(self, timestamp: datetime, status: StatusType, message: str):
+        self.timestamp = timestamp
+        self.status = status
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"[{self.timestamp:%Y-%m-%d %H:%M:%S}] [{self.status.name}] {self.message}"
+
+
+class LogReader:
+    """Reads the newest entries of a log written by `Logger`, reading fixed-size blocks backwards from the end so
+the cost depends on how many entries are read rather than the size of the log"""
+    BLOCK_SIZE = 64 * 1024
+    SEPARATOR = "=" * 83
+
+    def __init__(self, log_file_path: str):
+        self.file_dir = log_file_path
+        self.index_dir = f"{log_file_path}.idx"
+
+    def _load_index(self) -> tuple:
+        timestamps, offsets = [], []
+        try:
+            with open(self.index_dir, "r") as f:
+                for line in f:
+                    timestamp, offset = line.split()
+                    timestamps.append(float(timestamp))
+                    offsets.append(int(offset))
+        except (FileNotFoundError, ValueError):
+            pass
+        return timestamps, offsets
+
+    def _end_offset(self, until: datetime, file_size: int) -> int:
+        """Returns where to start reading backwards from so no entry after `until` needs to be read"""
+        if until is None:
+            return file_size
+        timestamps, offsets = self._load_index()
+        index = bisect_right(timestamps, until.timestamp())
+        # The first indexed entry after `until` starts after every entry we're after
+        return offsets[index] if index < len(offsets) else file_size
+
+    def _lines_backwards(self, f, end: int):
+        """Yields every line before `end` in the file, newest first"""
+        remainder = b""
+        position = end
+        while position > 0:
+            start = max(0, position - self.BLOCK_SIZE)
+            f.seek(start)
+            block = f.read(position - start) + remainder
+            position = start
+            lines = block.split(b"\n")
+            remainder = lines.pop(0)  # Might be the end of a line in the previous block
+            for line in reversed(lines):
+                yield line.decode("utf-8", errors="replace")
+        if remainder:
+            yield remainder.decode("utf-8", errors="replace")
+
+    def _entries_backwards(self, f, end: int):
+        """Yields every entry before `end`, newest first. Handles text and JSON entries, even mixed together."""
+        pending = None  # Lines of a text entry, newest first
+        for line in self._lines_backwards(f, end):
+            if pending is None:
+                if line == self.SEPARATOR:
+                    pending = []
+                elif line.startswith("{"):
+                    try:
+                        record = json.loads(line)
+                        yield LogEntry(datetime.fromisoformat(record["time"]), StatusType[record["status"]],
+                                       record["message"])
+                    except (ValueError, KeyError):
+                        pass
+                continue
+
+            # Text entries are read bottom up, so the entry is complete once its timestamp line is reached
+            if line.startswith("[") and line.endswith("]") and pending and pending[-1].startswith("[Status: "):
+                try:
+                    timestamp = datetime.fromisoformat(line[1:-1])
+                    status = StatusType[pending[-1][len("[Status: StatusType."):-1]]
+                except (ValueError, KeyError):
+                    pending.append(line)
+                    continue
+                yield LogEntry(timestamp, status, "\n".join(reversed(pending[:-1])))
+                pending = None
+                continue
+            pending.append(line)
+
+    def read(self, limit: int = 20, *, statuses=None, since: datetime = None, until: datetime = None) -> list:
+        """Returns up to `limit` of the newest entries, newest first. Entries can be filtered to a set of
+StatusTypes and to a time range. Blocks, so should be run in an executor."""
+        entries = []
+        try:
+            f = open(self.file_dir, "rb")
+        except FileNotFoundError:
+            return entries
+        with f:
+            end = self._end_offset(until, os.fstat(f.fileno()).st_size)
+            for entry in self._entries_backwards(f, end):
+                if since is not None and entry.timestamp < since:
+                    break
+                if until is not None and entry.timestamp > until:
+                    continue
+                if statuses is not None and entry.status not in statuses:
+                    continue
+                entries.append(entry)
+                if len(entries) >= limit:
+                    break
+        return entries
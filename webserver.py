@@ -1,19 +1,107 @@
-"""Keep the program running when idling"""
-from flask import Flask
-from threading import Thread
+"""Health checks and metrics, served from the bot's own event loop"""
+# Discord Imports
+from discord.ext import commands
 
-app = Flask("")
+# Other Imports
+from aiohttp import web
+import asyncio
+import time
 
+from metrics import CONTENT_TYPE
 
-@app.route("/")
-def home():
-    return "Webserver OK; Bot OK"
 
+class WebServer:
+    """An aiohttp server on the bot's loop with probes for an orchestrator:
 
-def run():
-    app.run(host="0.0.0.0", port=8080)
+`/health/live` fails once the event loop lags more than `max_loop_lag` seconds behind, meaning the process is stuck.
+`/health/ready` fails until the bot is connected and while heartbeats haven't been acknowledged for
+`max_heartbeat_age` seconds. Both return the bot's status as JSON. `/metrics` is served if the bot has metrics."""
+    def __init__(self, bot: commands.Bot, *, host: str = "0.0.0.0", port: int = 8080, max_loop_lag: float = 5.0,
+                 max_heartbeat_age: float = 60.0, lag_interval: float = 0.5):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.max_loop_lag = max_loop_lag
+        self.max_heartbeat_age = max_heartbeat_age
+        self.lag_interval = lag_interval
+        self.loop_lag = 0.0
 
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/", self.home),
+            web.get("/health/live", self.live),
+            web.get("/health/ready", self.ready),
+            web.get("/metrics", self.metrics),
+        ])
+        self._runner = None
+        self._lag_task = None
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.ensure_future(self._measure_loop_lag())
+
+    async def close(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _measure_loop_lag(self) -> None:
+        """Keeps `loop_lag` up to date with how late a sleep wakes up, i.e. how long callbacks are waiting to run"""
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag = max(0.0, loop.time() - start - self.lag_interval)
+
+    def _websockets(self) -> list:
+        """Returns the gateway connection of every shard (None for those that aren't connected)"""
+        shards = getattr(self.bot, "shards", None)
+        if shards:
+            return [getattr(getattr(shard, "_parent", None), "ws", None) for shard in shards.values()]
+        return [self.bot.ws]
+
+    def heartbeat_age(self):
+        """Returns the most seconds any shard has gone since its last acknowledged heartbeat, or None if none have
+been sent"""
+        ages = []
+        for ws in self._websockets():
+            last_ack = getattr(getattr(ws, "_keep_alive", None), "_last_ack", None)
+            if last_ack is not None:
+                ages.append(time.perf_counter() - last_ack)
+        return max(ages, default=None)
+
+    def status(self) -> dict:
+        heartbeat_age = self.heartbeat_age()
+        latency = self.bot.latency
+        websockets = self._websockets()
+        return {
+            "connected": bool(websockets) and None not in websockets and not self.bot.is_closed(),
+            "ready": self.bot.is_ready(),
+            "guilds": len(self.bot.guilds),
+            "latency": None if latency != latency else latency,  # NaN until the first heartbeat
+            "last_heartbeat_ack": heartbeat_age,
+            "loop_lag": self.loop_lag,
+        }
+
+    async def home(self, request):
+        return web.Response(text="Webserver OK; Bot OK" if self.bot.is_ready() else "Webserver OK; Bot starting")
+
+    async def live(self, request):
+        status = self.status()
+        return web.json_response(status, status=200 if self.loop_lag <= self.max_loop_lag else 503)
+
+    async def ready(self, request):
+        status = self.status()
+        heartbeat_age = status["last_heartbeat_ack"]
+        healthy = (status["connected"] and status["ready"]
+                   and (heartbeat_age is None or heartbeat_age <= self.max_heartbeat_age))
+        return web.json_response(status, status=200 if healthy else 503)
+
+    async def metrics(self, request):
+        if getattr(self.bot, "metrics", None) is None:
+            return web.Response(text="Metrics are turned off", status=404)
+        return web.Response(body=self.bot.metrics.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
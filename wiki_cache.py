@@ -0,0 +1,252 @@
+"""Two-tier cache of Wikipedia articles: parsed pages in memory, raw pages on disk"""
+# Other Imports
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from urllib.parse import unquote
+from hashlib import sha1
+import tempfile
+import asyncio
+import json
+import time
+import os
+
+from http_client import HTTPClient
+
+
+class CacheResult:
+    """The outcome of a cached lookup, `page` is whatever the parser returned (None unless status is 200)"""
+    __slots__ = ("url", "status", "page")
+
+    def __init__(self, url: str, status: int, page=None):
+        self.url = url
+        self.status = status
+        self.page = page
+
+
+def cache_key(url: str) -> str:
+    """Returns the normalized article title of a url made by `cleanup_url`"""
+    return unquote(url.rstrip("/").rsplit("/", 1)[-1])
+
+
+class WikiCache:
+    """Caches Wikipedia lookups by article title.
+
+Parsed pages are kept in an in-memory LRU, raw pages are kept on disk up to `disk_bytes` across at most
+`disk_entries` articles. Entries are fresh for `ttl` seconds, after which they are revalidated using their
+ETag/Last-Modified headers. Missing articles (404s) are cached for `negative_ttl` seconds, and count towards the
+disk limits like any other entry. Parsers are run on `parse_executor` (the default executor if None).
+
+Concurrent lookups of the same article share a single fetch, and every disk operation runs on one thread of the
+cache's own, so they never race each other."""
+    def __init__(self, http_client: HTTPClient, cache_dir: str, *, ttl: float = 3600, negative_ttl: float = 300,
+                 memory_entries: int = 256, disk_bytes: int = 100 * 1024 * 1024, disk_entries: int = 10000,
+                 parse_executor=None):
+        self.http_client = http_client
+        self.parse_executor = parse_executor
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.disk_entries = disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "revalidated": 0, "misses": 0,
+                      "evictions": 0}
+
+        self._memory = OrderedDict()  # (title, parser name) -> (expires at, CacheResult)
+        self._disk_sizes = None       # digest -> size of the entry's files on disk, loaded on first use
+        self._in_flight = {}          # digest -> task loading the raw page
+        self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wiki_cache")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    async def get(self, url: str, parser, *, remember: bool = True) -> CacheResult:
+        """Looks up an article, `parser` is called with the raw page and its result is cached in memory unless
+`remember` is False (for large one-off results). Urls that don't point at a specific article (such as
+Special:Random) are never cached."""
+        title = cache_key(url)
+        if title.startswith("Special:"):
+            response = await self.http_client.get(url)
+            self.stats["misses"] += 1
+            return await self._result(response.url, response.status, response.body, parser)
+
+        if not remember:
+            result, _ = await self._get_page(url, title, parser)
+            return result
+
+        memory_key = (title, parser.__name__)
+        cached = self._memory.get(memory_key)
+        if cached is not None and cached[0] > time.time():
+            self._memory.move_to_end(memory_key)
+            self.stats["memory_hits"] += 1
+            return cached[1]
+
+        result, max_age = await self._get_page(url, title, parser)
+        self._memory[memory_key] = (time.time() + max_age, result)
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+        return result
+
+    async def _get_page(self, url: str, title: str, parser) -> tuple:
+        """Returns the result for an article and how long it stays fresh for"""
+        digest = sha1(title.encode("utf-8")).hexdigest()
+        task = self._in_flight.get(digest)
+        if task is None:
+            task = self._in_flight[digest] = asyncio.ensure_future(self._load(url, digest))
+            task.add_done_callback(lambda _: self._in_flight.pop(digest, None))
+        # Shielded so one caller giving up doesn't cancel the load for everyone else waiting on it
+        page_url, status, body, max_age = await asyncio.shield(task)
+        return await self._result(page_url, status, body, parser), max_age
+
+    async def _load(self, url: str, digest: str) -> tuple:
+        """Returns the url, status and raw body of an article and how long it stays fresh for, from disk if possible"""
+        meta = await self._run(self._read_meta, digest)
+        now = time.time()
+
+        if meta is not None and meta["status"] == 404 and now - meta["fetched_at"] < self.negative_ttl:
+            self.stats["negative_hits"] += 1
+            return meta["url"], 404, None, self.negative_ttl - (now - meta["fetched_at"])
+
+        if meta is not None and meta["status"] == 200:
+            if now - meta["fetched_at"] < self.ttl:
+                body = await self._run(self._read_body, digest)
+                if body is not None:
+                    self.stats["disk_hits"] += 1
+                    return meta["url"], 200, body, self.ttl - (now - meta["fetched_at"])
+
+            headers = {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            if headers:
+                response = await self.http_client.get(url, headers=headers)
+                if response.status == 304:
+                    body = await self._run(self._read_body, digest)
+                    if body is not None:
+                        meta["fetched_at"] = now
+                        await self._run(self._write_meta, digest, meta)
+                        self.stats["revalidated"] += 1
+                        return meta["url"], 200, body, self.ttl
+                else:
+                    return await self._store(digest, response)
+
+        response = await self.http_client.get(url)
+        return await self._store(digest, response)
+
+    async def _store(self, digest: str, response) -> tuple:
+        self.stats["misses"] += 1
+        page = (response.url, response.status, response.body)
+        if response.status == 200:
+            meta = {"url": response.url, "status": 200, "fetched_at": time.time(),
+                    "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+            await self._run(self._write_page, digest, meta, response.body)
+            return (*page, self.ttl)
+        if response.status == 404:
+            meta = {"url": response.url, "status": 404, "fetched_at": time.time()}
+            await self._run(self._write_missing, digest, meta)
+            return (*page, self.negative_ttl)
+        return (*page, 0)  # Don't keep errors around
+
+    async def _result(self, url: str, status: int, body: bytes, parser) -> CacheResult:
+        if status != 200:
+            return CacheResult(url, status)
+        page = await asyncio.get_event_loop().run_in_executor(self.parse_executor, parser, body)
+        return CacheResult(url, status, page)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._disk_executor, func, *args)
+
+    def clear_memory(self) -> None:
+        self._memory.clear()
+
+    def close(self) -> None:
+        self._disk_executor.shutdown(wait=False)
+
+    # Disk storage, these block so should only be called through `_run`
+    def _path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.{extension}")
+
+    def _read_meta(self, digest: str):
+        try:
+            with open(self._path(digest, "json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _read_body(self, digest: str):
+        try:
+            with open(self._path(digest, "html"), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(self._path(digest, "html"))  # Mark as recently used for eviction
+        return body
+
+    def _write_file(self, path: str, data: bytes) -> None:
+        """Writes a file under a unique temporary name first, so it's either fully written or not there at all"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _write_meta(self, digest: str, meta: dict) -> None:
+        self._write_file(self._path(digest, "json"), json.dumps(meta).encode("utf-8"))
+
+    def _write_page(self, digest: str, meta: dict, body: bytes) -> None:
+        self._write_file(self._path(digest, "html"), body)
+        self._write_meta(digest, meta)
+        self._track(digest)
+
+    def _write_missing(self, digest: str, meta: dict) -> None:
+        self._write_meta(digest, meta)
+        self._track(digest)
+
+    def _track(self, digest: str) -> None:
+        """Records the size of an entry that was just written, then evicts entries if the cache is too big"""
+        sizes = self._load_disk_sizes()
+        sizes[digest] = 0
+        for extension in ("html", "json"):
+            try:
+                sizes[digest] += os.stat(self._path(digest, extension)).st_size
+            except FileNotFoundError:
+                pass
+        self._evict(sizes)
+
+    def _load_disk_sizes(self) -> dict:
+        if self._disk_sizes is None:
+            self._disk_sizes = {}
+            for entry in os.scandir(self.cache_dir):
+                digest, _, extension = entry.name.partition(".")
+                if extension in ("html", "json"):
+                    self._disk_sizes[digest] = self._disk_sizes.get(digest, 0) + entry.stat().st_size
+        return self._disk_sizes
+
+    def _evict(self, sizes: dict) -> None:
+        """Removes the least recently used entries until the cache fits in `disk_bytes` and `disk_entries`"""
+        total = sum(sizes.values())
+        if total <= self.disk_bytes and len(sizes) <= self.disk_entries:
+            return
+
+        def last_used(digest):
+            # Pages are touched when read, missing articles only have their meta file
+            for extension in ("html", "json"):
+                try:
+                    return os.stat(self._path(digest, extension)).st_mtime
+                except FileNotFoundError:
+                    pass
+            return 0
+
+        for digest in sorted(sizes, key=last_used):
+            if total <= self.disk_bytes and len(sizes) <= self.disk_entries:
+                break
+            total -= sizes.pop(digest)
+            for extension in ("html", "json"):
+                try:
+                    os.remove(self._path(digest, extension))
+                except FileNotFoundError:
+                    pass
+            self.stats["evictions"] += 1
@@ -0,0 +1,212 @@
+"""Offline Wikipedia title/abstract index, built from an abstracts dump and read through memory maps.
+
+Build an index (the dump is streamed, so it never has to fit in memory):
+    python wiki_offline.py build enwiki-latest-abstract.xml.gz resources/wiki_index
+Look up a title:
+    python wiki_offline.py lookup resources/wiki_index "python (programming language)"
+
+Dumps can be Wikipedia's abstract XML (optionally gzipped) or JSON lines with "title" and "abstract" keys.
+The index is a directory holding `records.dat`, one `key<TAB>title<TAB>abstract` line per article sorted by key,
+and `offsets.dat`, the starting byte of every record as little-endian unsigned 64-bit integers.
+"""
+# Other Imports
+from xml.etree.ElementTree import iterparse
+from array import array
+import tempfile
+import heapq
+import json
+import gzip
+import mmap
+import sys
+import os
+
+RECORDS_FILE = "records.dat"
+OFFSETS_FILE = "offsets.dat"
+
+
+def normalize_title(title: str) -> str:
+    """Returns the key a title is stored under, case, underscores and extra spaces don't matter"""
+    return " ".join(title.replace("_", " ").lower().split())
+
+
+def _clean(text: str) -> str:
+    return " ".join((text or "").split())  # Tabs and newlines would break the record format
+
+
+def _open_dump(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def iter_dump(path: str):
+    """Yields (title, abstract) for every article in a dump, one at a time"""
+    if path.endswith((".jsonl", ".jsonl.gz", ".json", ".json.gz")):
+        with _open_dump(path) as f:
+            for line in f:
+                if line.strip():
+                    article = json.loads(line)
+                    yield article["title"], article.get("abstract", "")
+        return
+
+    with _open_dump(path) as f:
+        root = title = abstract = None
+        for event, element in iterparse(f, events=("start", "end")):
+            if root is None:
+                root = element  # The first event is the start of the root
+            if event != "end":
+                continue
+            if element.tag == "title":
+                title = element.text or ""
+                if title.startswith("Wikipedia: "):
+                    title = title[len("Wikipedia: "):]
+            elif element.tag == "abstract":
+                abstract = element.text or ""
+            elif element.tag == "doc":
+                if title:
+                    yield title, abstract or ""
+                title = abstract = None
+                # Don't keep already read articles in memory, a cleared article would still be kept by the root
+                root.clear()
+
+
+def _write_run(records: list, directory: str) -> str:
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.writelines(f"{key}\t{title}\t{abstract}\n" for key, title, abstract in records)
+    return path
+
+
+def build_index(dump_path: str, index_dir: str, run_size: int = 200_000) -> int:
+    """Builds an index from a dump, returns the number of articles in it.
+Articles are sorted in runs of `run_size` that are merged from disk, so memory use doesn't grow with the dump."""
+    os.makedirs(index_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=index_dir) as temp_dir:
+        runs, records = [], []
+        for title, abstract in iter_dump(dump_path):
+            key = normalize_title(title)
+            if key:
+                records.append((key, _clean(title), _clean(abstract)))
+            if len(records) >= run_size:
+                runs.append(_write_run(records, temp_dir))
+                records = []
+        if records:
+            runs.append(_write_run(records, temp_dir))
+
+        run_files = [open(path, "r", encoding="utf-8") for path in runs]
+        count, last_key, offsets = 0, None, array("Q")
+        records_path = os.path.join(index_dir, RECORDS_FILE)
+        offsets_path = os.path.join(index_dir, OFFSETS_FILE)
+        try:
+            with open(f"{records_path}.tmp", "wb") as records_file, open(f"{offsets_path}.tmp", "wb") as offsets_file:
+                for line in heapq.merge(*run_files):
+                    key = line.split("\t", 1)[0]
+                    if key == last_key:
+                        continue  # Keep the first article for each title
+                    last_key = key
+                    offsets.append(records_file.tell())
+                    records_file.write(line.encode("utf-8"))
+                    count += 1
+                    if len(offsets) >= 65536:
+                        offsets.tofile(offsets_file)
+                        offsets = array("Q")
+                offsets.tofile(offsets_file)
+        finally:
+            for f in run_files:
+                f.close()
+
+    if sys.byteorder != "little":
+        _swap_offsets(f"{offsets_path}.tmp")
+    os.replace(f"{records_path}.tmp", records_path)
+    os.replace(f"{offsets_path}.tmp", offsets_path)
+    return count
+
+
+def _swap_offsets(path: str) -> None:
+    offsets = array("Q")
+    with open(path, "rb") as f:
+        offsets.frombytes(f.read())
+    offsets.byteswap()
+    with open(path, "wb") as f:
+        offsets.tofile(f)
+
+
+class OfflineIndex:
+    """Read-only lookups into an index made by `build_index`, a binary search over memory-mapped files"""
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._records_file = open(os.path.join(index_dir, RECORDS_FILE), "rb")
+        self._offsets_file = open(os.path.join(index_dir, OFFSETS_FILE), "rb")
+        self._records = self._map(self._records_file)
+        self._offsets = self._map(self._offsets_file)
+        self._count = len(self._offsets) // 8 if self._offsets is not None else 0
+
+    @staticmethod
+    def _map(f):
+        if os.fstat(f.fileno()).st_size == 0:
+            return None  # Empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _offset(self, index: int) -> int:
+        return int.from_bytes(self._offsets[index * 8:index * 8 + 8], "little")
+
+    def _key(self, index: int) -> bytes:
+        start = self._offset(index)
+        return self._records[start:self._records.find(b"\t", start)]
+
+    def _record(self, index: int) -> tuple:
+        start = self._offset(index)
+        line = self._records[start:self._records.find(b"\n", start)].decode("utf-8")
+        return tuple(line.split("\t"))
+
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, title: str):
+        """Returns (title, abstract) for an article, or None if it isn't in the index"""
+        key = normalize_title(title).encode("utf-8")
+        index = self._bisect(key)
+        if index < self._count and self._key(index) == key:
+            return self._record(index)[1:]
+        return None
+
+    def titles_with_prefix(self, prefix: str, limit: int = 10) -> list:
+        """Returns up to `limit` titles whose key starts with the given prefix, in key order"""
+        key = normalize_title(prefix).encode("utf-8")
+        titles = []
+        index = self._bisect(key)
+        while index < self._count and len(titles) < limit and self._key(index).startswith(key):
+            titles.append(self._record(index)[1])
+            index += 1
+        return titles
+
+    def close(self) -> None:
+        for mapped in (self._records, self._offsets):
+            if mapped is not None:
+                mapped.close()
+        self._records_file.close()
+        self._offsets_file.close()
+
+
+def main() -> None:
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        print(f"Indexed {build_index(sys.argv[2], sys.argv[3])} articles into {sys.argv[3]}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "lookup":
+        index = OfflineIndex(sys.argv[2])
+        print(index.lookup(sys.argv[3]) or "Not found")
+        index.close()
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
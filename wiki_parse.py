@@ -0,0 +1,221 @@
+"""Text extraction for Wikipedia articles, meant to be run off the event loop on the pool from `get_pool`"""
+# Other Imports
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+import gzip
+import io
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+CHUNK_SIZE = 4 * 1024  # Bytes fed to the parser at a time, so parsing can stop partway through a page
+_pool = None
+
+
+def get_pool():
+    """Returns the executor shared by all extraction work, a process pool where the platform supports one"""
+    global _pool
+    if _pool is None:
+        try:
+            _pool = ProcessPoolExecutor(max_workers=2)
+        except (NotImplementedError, OSError):
+            _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wiki_parse")
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {"p": 0, **HEADING_LEVELS}
+
+
+class _BlockParser(HTMLParser):
+    """Collects (level, text) for each heading (levels 1-6) and paragraph (level 0) it has seen in `blocks`.
+Only the article's `firstHeading` is collected at level 1, and section edit links are skipped."""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._block_tag = None
+        self._block_depth = 0
+        self._block_text = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._block_tag is None:
+            if tag in BLOCK_TAGS and (tag != "h1" or ("id", "firstHeading") in attrs):
+                self._block_tag, self._block_depth, self._block_text = tag, 1, []
+            return
+
+        if tag == self._block_tag:
+            self._block_depth += 1
+        if self._skip_depth:
+            self._skip_depth += 1
+        elif "mw-editsection" in (dict(attrs).get("class") or ""):
+            self._skip_depth = 1
+
+    def handle_endtag(self, tag):
+        if self._block_tag is None:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+        if tag == self._block_tag:
+            self._block_depth -= 1
+            if not self._block_depth:
+                text = "".join(self._block_text)
+                if text.strip():
+                    self.blocks.append((BLOCK_TAGS[tag], text))
+                self._block_tag, self._skip_depth = None, 0
+
+    def handle_data(self, data):
+        if self._block_tag is not None and not self._skip_depth:
+            self._block_text.append(data)
+
+
+def _iter_blocks_stdlib(page: bytes):
+    parser = _BlockParser()
+    text = page.decode("utf-8", errors="replace")
+    for start in range(0, len(text), CHUNK_SIZE):
+        parser.feed(text[start:start + CHUNK_SIZE])
+        yield from parser.blocks
+        parser.blocks.clear()
+    parser.close()
+    yield from parser.blocks
+
+
+def _element_text(element) -> str:
+    """Returns all text inside an lxml element, skipping comments and section edit links"""
+    parts = [element.text or ""]
+    for child in element:
+        if isinstance(child.tag, str) and "mw-editsection" not in (child.get("class") or ""):
+            parts.append(_element_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _iter_blocks_lxml(page: bytes):
+    parser = etree.HTMLPullParser(events=("end",), encoding="utf-8")
+    for start in range(0, len(page) + 1, CHUNK_SIZE):
+        if start < len(page):
+            parser.feed(page[start:start + CHUNK_SIZE])
+        else:
+            parser.close()
+        for _, element in parser.read_events():
+            if element.tag not in BLOCK_TAGS or (element.tag == "h1" and element.get("id") != "firstHeading"):
+                continue
+            text = _element_text(element)
+            element.clear(keep_tail=True)  # The tree isn't needed, so don't keep the text around
+            if text.strip():
+                yield BLOCK_TAGS[element.tag], text
+
+
+def iter_blocks(page: bytes):
+    """Yields (level, text) for the article heading (level 1), each section heading (levels 2-6) and each non-empty
+paragraph (level 0) in the order they appear, using lxml if it's installed. The page is parsed a chunk at a
+time as blocks are consumed, so stopping early skips parsing the rest of the page."""
+    if etree is not None:
+        return _iter_blocks_lxml(page)
+    return _iter_blocks_stdlib(page)
+
+
+def _collect(blocks, max_paragraphs: int = None) -> tuple:
+    heading, paragraphs = None, []
+    for level, text in blocks:
+        if level == 1 and heading is None:
+            heading = text.strip()
+        elif level == 0:
+            paragraphs.append(text)
+        if max_paragraphs is not None and heading is not None and len(paragraphs) >= max_paragraphs:
+            break
+    return heading, paragraphs
+
+
+def _parse_stdlib(page: bytes, max_paragraphs: int = None) -> tuple:
+    return _collect(_iter_blocks_stdlib(page), max_paragraphs)
+
+
+def _parse_lxml(page: bytes, max_paragraphs: int = None) -> tuple:
+    return _collect(_iter_blocks_lxml(page), max_paragraphs)
+
+
+def parse(page: bytes, max_paragraphs: int = None) -> tuple:
+    """Returns the heading and the non-empty paragraphs of an article, using lxml if it's installed.
+Stops reading the page once `max_paragraphs` paragraphs and the heading have been found."""
+    return _collect(iter_blocks(page), max_paragraphs)
+
+
+def extract_summary(page: bytes) -> tuple:
+    """Returns the heading and first paragraph of an article"""
+    heading, paragraphs = parse(page, max_paragraphs=1)
+    return heading, paragraphs[0] if paragraphs else ""
+
+
+def extract_article(page: bytes) -> tuple:
+    """Returns the heading and every paragraph of an article"""
+    return parse(page)
+
+
+class _SplitWriter:
+    """Writes text into in-memory files (gzipped if `compress`), starting a new file whenever the next write could
+push the current one over `max_size` bytes"""
+    FLUSH_EVERY = 1024 * 1024  # Raw bytes between gzip flushes, bounds how far the compressed size can lag behind
+    OVERHEAD = 1024            # Room left for the gzip header/trailer
+
+    def __init__(self, compress: bool, max_size: int):
+        self.compress = compress
+        self.max_size = max_size
+        self.parts = []
+        self._start_part()
+
+    def _start_part(self) -> None:
+        self._buffer = io.BytesIO()
+        self._stream = gzip.GzipFile(fileobj=self._buffer, mode="wb") if self.compress else self._buffer
+        self._unflushed = 0
+        self._empty = True
+
+    def _finish_part(self) -> None:
+        if self.compress:
+            self._stream.close()
+        self.parts.append(self._buffer.getvalue())
+
+    def write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        size_bound = self._buffer.tell() + self._unflushed + len(data) + (self.OVERHEAD if self.compress else 0)
+        if not self._empty and size_bound > self.max_size:
+            self._finish_part()
+            self._start_part()
+
+        self._stream.write(data)
+        self._empty = False
+        if self.compress:
+            self._unflushed += len(data)
+            if self._unflushed >= self.FLUSH_EVERY:
+                self._stream.flush()
+                self._unflushed = 0
+
+    def close(self) -> list:
+        self._finish_part()
+        return self.parts
+
+
+def export_article(page: bytes, *, sections: bool = False, compress: bool = False,
+                   max_size: int = 8 * 1024 * 1024) -> tuple:
+    """Streams an article's text straight into in-memory files, returns its heading and a list of file contents.
+Section headings are written as `== Heading ==` lines if `sections` is True, files are gzipped if `compress` is
+True, and the text is split across several files if it wouldn't fit into one file of `max_size` bytes."""
+    writer = _SplitWriter(compress, max_size)
+    heading = None
+    for level, text in iter_blocks(page):
+        if level == 1:
+            heading = heading or text.strip()
+        elif level == 0:
+            writer.write(text)
+        elif sections:
+            writer.write(f"\n{'=' * level} {text.strip()} {'=' * level}\n\n")
+    return heading, writer.close()
@@ -0,0 +1,76 @@
+"""'Did you mean' suggestions for Wikipedia titles"""
+# Other Imports
+from collections import OrderedDict, Counter
+from bisect import bisect_left, insort
+from heapq import nlargest
+
+from wiki_offline import normalize_title
+
+
+def trigrams(key: str) -> set:
+    padded = f"${key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleSuggester:
+    """Ranks known titles against a query using a sorted key list for prefix matches and a trigram index for typos.
+
+Titles are added as they're looked up. At most `max_titles` are kept (roughly 1 KiB of memory each, including
+their trigrams), past that the least recently used titles are dropped."""
+    def __init__(self, max_titles: int = 50_000, min_score: float = 0.3):
+        self.max_titles = max_titles
+        self.min_score = min_score
+        self._titles = OrderedDict()  # key -> (title, number of trigrams), in least to most recently used order
+        self._keys = []               # Sorted keys, for prefix matches
+        self._trigrams = {}           # trigram -> set of keys
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def add(self, title: str) -> None:
+        key = normalize_title(title)
+        if not key:
+            return
+        if key in self._titles:
+            self._titles.move_to_end(key)
+            return
+
+        key_trigrams = trigrams(key)
+        self._titles[key] = (title, len(key_trigrams))
+        insort(self._keys, key)
+        for trigram in key_trigrams:
+            self._trigrams.setdefault(trigram, set()).add(key)
+        while len(self._titles) > self.max_titles:
+            self._remove(next(iter(self._titles)))
+
+    def _remove(self, key: str) -> None:
+        del self._titles[key]
+        del self._keys[bisect_left(self._keys, key)]
+        for trigram in trigrams(key):
+            keys = self._trigrams[trigram]
+            keys.discard(key)
+            if not keys:
+                del self._trigrams[trigram]
+
+    def suggest(self, query: str, limit: int = 5) -> list:
+        """Returns up to `limit` known titles that best match the query, best first"""
+        query = normalize_title(query)
+        if not query:
+            return []
+
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        titles = self._titles
+        scores = {key: 2 * count / (len(query_trigrams) + titles[key][1]) for key, count in shared.items() if count > 1}
+
+        # Titles starting with the query are very likely what was meant
+        start = bisect_left(self._keys, query)
+        for key in self._keys[start:start + limit]:
+            if not key.startswith(query):
+                break
+            scores[key] = max(scores.get(key, 0), 0.5) + 0.5
+
+        best = nlargest(limit, ((score, key) for key, score in scores.items() if score >= self.min_score))
+        return [titles[key][0] for _, key in best]